@@ -0,0 +1,148 @@
+import numpy as np
+
+# Batteries of a whole community as arrays, one entry per participant (capacity 0 for consumers).
+# capacity and soc (stored energy in kWh) are usually the battery_capacity and storage arrays of a
+# CommunityState, so the state, its participant views and checkpoints see the same values. Rates limit
+# the energy charged or discharged per call (one call per time slot), efficiency is the share of
+# charged energy that ends up stored.
+class BatteryFleet:
+    def __init__(self, capacity, soc, charge_rate=np.inf, discharge_rate=np.inf, efficiency=1.0):
+        self.charge_rate = np.empty(0)
+        self.discharge_rate = np.empty(0)
+        self.efficiency = np.empty(0)
+        self.bind(capacity, soc)
+        self.charge_rate[:] = charge_rate
+        self.discharge_rate[:] = discharge_rate
+        self.efficiency[:] = efficiency
+
+    def __len__(self):
+        return len(self.capacity)
+
+    # Use new capacity and soc arrays (e.g. after CommunityState.append), new units get unlimited rates
+    def bind(self, capacity, soc):
+        self.capacity = capacity
+        self.soc = soc
+        grow = len(capacity) - len(self.efficiency)
+        self.charge_rate = np.append(self.charge_rate, np.full(grow, np.inf))
+        self.discharge_rate = np.append(self.discharge_rate, np.full(grow, np.inf))
+        self.efficiency = np.append(self.efficiency, np.ones(grow))
+
+    # Charge the units with energy, returns the energy that could not be stored
+    def charge(self, units, energy):
+        accepted = np.minimum(energy, self.charge_rate[units])
+        efficiency = self.efficiency[units]
+        capacity = self.capacity[units]
+        new_soc = self.soc[units] + accepted * efficiency
+        self.soc[units] = np.minimum(new_soc, capacity)
+        return (energy - accepted) + np.maximum(new_soc - capacity, 0) / efficiency
+
+    # Discharge the units to cover needed, returns the energy delivered
+    def discharge(self, units, needed):
+        delivered = np.minimum(needed, np.minimum(self.soc[units], self.discharge_rate[units]))
+        self.soc[units] -= delivered
+        return delivered
+
+# A dispatch policy decides when the prosumers' batteries are used. before_trading runs after the
+# prosumers' own consumption and before OTC contracts and trading, after_trading receives the
+# unmatched ask quantities of a slot and returns what is left for the provider. The helpers work on
+# all prosumers of a VectorizedCDAMarket at once.
+class DispatchPolicy:
+    name = None
+
+    # Name and parameters, recorded in checkpoints so a run only continues with the same policy
+    def config(self):
+        return {"name": self.name, **vars(self)}
+
+    def before_trading(self, market, time_slot):
+        pass
+
+    def after_trading(self, market, units, quantities, time_slot):
+        return quantities
+
+    # Store the surplus of prosumers before trading, what does not fit stays as supply
+    def charge_surplus(self, market, time_slot):
+        supply = market.state.supply[:, time_slot]
+        prosumers = market.prosumers
+        net_energy = supply[prosumers] - market.state.demand[prosumers, time_slot]
+        charging = prosumers[net_energy > 0]
+        supply[charging] = market.fleet.charge(charging, net_energy[net_energy > 0])
+        if 'battery_load' in market.events.wanted:
+            for index in charging:
+                market.events.emit('battery_load', market.state.ids[index], supply[index], time_slot)
+
+    # Cover the demand of prosumers from their batteries
+    def discharge_deficit(self, market, time_slot):
+        demand = market.state.demand[:, time_slot]
+        prosumers = market.prosumers
+        net_energy = market.state.supply[prosumers, time_slot] - demand[prosumers]
+        discharging = prosumers[net_energy < 0]
+        needed = -net_energy[net_energy < 0]
+        withdrawn = market.fleet.discharge(discharging, needed)
+        demand[discharging] -= withdrawn
+        if 'battery_withdraw' in market.events.wanted:
+            for index, need, amount in zip(discharging, needed, withdrawn):
+                market.events.emit('battery_withdraw', market.state.ids[index], need, amount, time_slot)
+
+    def store(self, market, units, quantities):
+        return market.fleet.charge(units, quantities)
+
+class NoBattery(DispatchPolicy):
+    name = 'no_bat'
+
+# Store surplus before trading and sell only what does not fit, batteries cover demand first ('bat_CDA')
+class ChargeFirst(DispatchPolicy):
+    name = 'bat_CDA'
+
+    def before_trading(self, market, time_slot):
+        self.charge_surplus(market, time_slot)
+        self.discharge_deficit(market, time_slot)
+
+# Trade the surplus first and store what is left unmatched, batteries cover demand first ('CDA_bat')
+class TradeFirst(DispatchPolicy):
+    name = 'CDA_bat'
+
+    def before_trading(self, market, time_slot):
+        self.discharge_deficit(market, time_slot)
+
+    def after_trading(self, market, units, quantities, time_slot):
+        return self.store(market, units, quantities)
+
+# Compare the average trade price of the previous slot (the middle of the price range when there is
+# none) with threshold: below it surplus is stored and demand is bought from the market, at or above it
+# batteries cover demand, surplus is traded and only the unmatched rest is stored
+class PriceThreshold(DispatchPolicy):
+    name = 'price_threshold'
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold
+
+    def cheap(self, market, time_slot):
+        threshold = (market.min_price + market.max_price) / 2 if self.threshold is None else self.threshold
+        previous = market.metrics.slots.get(time_slot - 1)
+        price = previous.average_price() if previous is not None and previous.count > 0 else (market.min_price + market.max_price) / 2
+        return price < threshold
+
+    def before_trading(self, market, time_slot):
+        if self.cheap(market, time_slot):
+            self.charge_surplus(market, time_slot)
+        else:
+            self.discharge_deficit(market, time_slot)
+
+    def after_trading(self, market, units, quantities, time_slot):
+        if self.cheap(market, time_slot):
+            return quantities
+        return self.store(market, units, quantities)
+
+policies = {policy.name: policy for policy in (NoBattery, ChargeFirst, TradeFirst, PriceThreshold)}
+
+# Battery option as recorded in checkpoint configurations
+def battery_config(battery):
+    return battery.config() if isinstance(battery, DispatchPolicy) else battery
+
+# Policy for a battery option, the names of run_market ('bat_CDA', 'CDA_bat', 'no_bat') or a policy object
+def battery_policy(battery):
+    if isinstance(battery, DispatchPolicy):
+        return battery
+    if battery not in policies:
+        raise ValueError(f"Unknown battery option {battery!r}, expected one of {sorted(policies)} or a DispatchPolicy")
+    return policies[battery]()
@@ -0,0 +1,306 @@
+import argparse
+import gc
+import heapq
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import simulation
+from indexes import calculate_average_price, calculate_price_dispersion, calculate_payment_reduction, calculate_income_increase, calculate_community_welfare
+from market import CDAMarket, OrderBook, zi_strategy, eob_strategy, zi_batch_strategy, eob_batch_strategy
+
+min_price = 0.1327
+max_price = 0.4175
+order_book_sizes = [36, 360, 3600, 10000, 50000]
+legacy_limit = 10000        # the list based matching is quadratic, skip it for bigger books
+import_modules = ['loadProfiles', 'simulation', 'sweep']
+max_import_seconds = 1.0
+suite_sizes = [36, 360, 3600]
+suite_day_sizes = [36, 360]
+suite_rounds = [5, 15]
+suite_strategies = [zi_strategy, eob_strategy, zi_batch_strategy, eob_batch_strategy]
+benchmark_slot = 48        # noon, prosumers have excess energy to sell
+regression_tolerance = 0.25
+noise_floor = 0.002         # seconds, slowdowns below this are timer jitter and never count as regressions
+suite_repeats = 5           # runs per case, the best one is reported
+day_repeats = 5             # runs per full day
+min_case_seconds = 0.5      # a case is repeated for at least this long, so the best run is not from one busy moment
+confirm_retries = 2         # times a case that looks slower than the baseline is measured again
+
+# Previous list based matching: sort both sides every round and remove matched orders from the list
+def legacy_match(order_book):
+    bids = sorted([order for order in order_book if order[1] == 'bid'], key=lambda x: -x[2])
+    asks = sorted([order for order in order_book if order[1] == 'ask'], key=lambda x: x[2])
+    matches = []
+    for i in range(min(len(bids), len(asks))):
+        bid = bids[i]
+        ask = asks[i]
+        if bid[2] >= ask[2]:
+            quantity = min(bid[3], ask[3])
+            matches.append((ask[0], bid[0], quantity, (bid[2] + ask[2]) / 2))
+            order_book.remove(bid)
+            order_book.remove(ask)
+            if bid[3] - quantity > 0:
+                order_book.append((bid[0], 'bid', bid[2], bid[3] - quantity, bid[4]))
+            if ask[3] - quantity > 0:
+                order_book.append((ask[0], 'ask', ask[2], ask[3] - quantity, ask[4]))
+    return matches
+
+# One order per participant, half of them consumers bidding and half prosumers asking
+def random_orders(num_participants, rng):
+    prices = rng.uniform(min_price, max_price, num_participants)
+    quantities = np.round(rng.uniform(0.01, 0.5, num_participants), 3)
+    orders = []
+    for i in range(num_participants):
+        side = 'bid' if i % 2 == 0 else 'ask'
+        orders.append((f'{side}{i}', side, float(prices[i]), float(quantities[i]), 0))
+    return orders
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# Time one round of order submission plus matching for growing communities
+def bench_order_book(sizes=order_book_sizes, repeats=3, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        orders = random_orders(size, rng)
+
+        def heap_round():
+            book = OrderBook()
+            for order in orders:
+                book.add(*order)
+            return book.match()
+
+        def legacy_round():
+            return legacy_match(list(orders))
+
+        heap_time = best_time(heap_round, repeats)
+        legacy_time = best_time(legacy_round, repeats) if size <= legacy_limit else None
+        if legacy_time is not None:
+            assert heap_round() == legacy_round()
+        results.append({"participants": size, "order_book": heap_time, "legacy": legacy_time})
+    return results
+
+# Cold import time of the modules a headless sweep worker loads, each measured in a fresh interpreter
+# without a display and reduced by the startup time of the interpreter itself
+def bench_import_time(modules=import_modules, repeats=5):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    environment = {**os.environ, 'MPLBACKEND': 'Agg'}
+
+    def interpreter_time(code):
+        return best_time(lambda: subprocess.run([sys.executable, '-c', code], cwd=directory, env=environment, check=True), repeats)
+
+    startup = interpreter_time('pass')
+    return [{"module": module, "import": max(interpreter_time(f'import {module}') - startup, 0)} for module in modules]
+
+# Best time of run(setup()) where only run is timed, for operations that change the state they work on.
+# Like timeit, garbage left by earlier cases is collected first and the collector is off while timing.
+# Short operations are repeated until min_seconds have passed (setup included), at most max_repeats times.
+def measure(setup, run, repeats, min_seconds=0, max_repeats=1000):
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeats or (time.perf_counter() - started < min_seconds and len(times) < max_repeats):
+        state = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return min(times)
+
+def benchmark_market(num_participants, seed=0):
+    np.random.seed(seed)
+    participants = simulation.initialize_participants(num_participants // 2, num_participants - num_participants // 2)
+    contracts = [(f'C{i + 1}', f'P{i + 1}', 0.05, 0.2) for i in range(num_participants // 2)]
+    market = CDAMarket(participants, contracts, simulation.min_price, simulation.max_price)
+    market.balance_prosumer_energy(benchmark_slot)
+    return market
+
+# Market with the orders of one round already in the book
+def collected_market(num_participants, strategy):
+    market = benchmark_market(num_participants)
+    market.collect_orders(strategy, benchmark_slot, 0, 15)
+    return market
+
+# Participants of a benchmark day, the global RNG is seeded so every run trades the same orders
+def day_participants(num_participants, seed=0):
+    np.random.seed(seed)
+    return simulation.initialize_participants(num_participants // 2, num_participants - num_participants // 2)
+
+# Cases of the suite as (parameters, setup, run, repeats), every size, strategy and rounds per slot.
+# Loop values are bound as default arguments so a case can be measured again later.
+def suite_cases(sizes=suite_sizes, day_sizes=suite_day_sizes, rounds_options=suite_rounds, strategies=suite_strategies, repeats=suite_repeats,
+                day_repeats=day_repeats):
+    cases = []
+
+    def case(name, setup, run, repeats, **parameters):
+        cases.append(({"name": name, **parameters}, setup, run, repeats))
+
+    for size in sizes:
+        for strategy in strategies:
+            case('collect_orders', lambda size=size, strategy=strategy: collected_market(size, strategy),
+                 lambda market, strategy=strategy: market.collect_orders(strategy, benchmark_slot, 1, 15), repeats,
+                 participants=size, strategy=strategy.__name__)
+            case('match_orders', lambda size=size, strategy=strategy: collected_market(size, strategy),
+                 lambda market: market.match_orders(benchmark_slot), repeats,
+                 participants=size, strategy=strategy.__name__)
+        case('clear_market', lambda size=size: collected_market(size, zi_strategy),
+             lambda market: market.clear_market('CDA_bat'), repeats, participants=size)
+        case('apply_otc_contracts', lambda size=size: benchmark_market(size),
+             lambda market: market.apply_otc_contracts(benchmark_slot), repeats, participants=size)
+
+    for size in day_sizes:
+        for rounds in rounds_options:
+            for strategy in strategies:
+                case('run_simulation', lambda size=size: day_participants(size),
+                     lambda participants, strategy=strategy, rounds=rounds: simulation.run_market(strategy, 'bat_CDA', participants=participants, rounds=rounds),
+                     day_repeats, participants=size, rounds=rounds, strategy=strategy.__name__)
+
+    for size in day_sizes:
+        for strategy in strategies:
+            case('run_simulation_incremental', lambda size=size: day_participants(size),
+                 lambda participants, strategy=strategy: simulation.run_market(strategy, 'bat_CDA', participants=participants, incremental=True),
+                 day_repeats, participants=size, strategy=strategy.__name__)
+
+    for size in day_sizes:
+        market, trades = simulation.run_market(zi_strategy, 'bat_CDA', participants=day_participants(size))
+
+        def indexes(trades, market=market):
+            average_price = calculate_average_price(trades)
+            calculate_price_dispersion(trades, average_price)
+            calculate_payment_reduction(trades, market.traditional_buyers, market.provider_buy)
+            calculate_income_increase(trades, market.traditional_sellers, market.provider_sell)
+            calculate_community_welfare(trades, market.traditional_sellers, market.traditional_buyers, market.provider_buy, market.provider_sell)
+
+        case('indexes', lambda trades=trades: trades, indexes, repeats, participants=size, trades=len(trades))
+    return cases
+
+# Fixed workload that runs no simulation code (heap, dict and numpy operations like the market uses), its
+# time tells how fast the machine is at the moment. Reports are compared relative to it.
+def calibration_workload(size=20000):
+    heap = []
+    orders = {}
+    for i in range(size):
+        heapq.heappush(heap, ((i * 7919) % 10007, i))
+        orders[i] = [i, 'bid', i * 0.5, 1.0, 0]
+    while heap:
+        orders.pop(heapq.heappop(heap)[1])
+    np.sort(np.arange(10 * size)[::-1] * 0.5)
+
+def calibrate():
+    return measure(lambda: None, lambda state: calibration_workload(), suite_repeats, min_case_seconds)
+
+def measure_case(case):
+    parameters, setup, run, repeats = case
+    return {**parameters, "seconds": measure(setup, run, repeats, min_case_seconds)}
+
+# Time the market hot paths; results are flat records
+def bench_suite(**options):
+    return [measure_case(case) for case in suite_cases(**options)]
+
+def result_key(result):
+    return tuple((name, value) for name, value in result.items() if name != 'seconds')
+
+# Results slower than the baseline by more than tolerance (relative) and more than noise_floor seconds,
+# as (result, baseline seconds), and the baseline results that have no matching result. With the
+# calibration time of both runs the baseline times are scaled to the current speed of the machine.
+def compare_to_baseline(results, baseline, tolerance=regression_tolerance, noise_floor=noise_floor, calibration=None):
+    scale = calibration / baseline['calibration'] if calibration and baseline.get('calibration') else 1
+    baseline_times = {result_key(result): result['seconds'] * scale for result in baseline['results']}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key in baseline_times and result['seconds'] - baseline_times[key] > max(baseline_times[key] * tolerance, noise_floor):
+            regressions.append((result, baseline_times[key]))
+    keys = {result_key(result) for result in results}
+    missing = [result for result in baseline['results'] if result_key(result) not in keys]
+    return regressions, missing
+
+# Measure the cases of regressions again (at most retries times) and keep the best time, so only
+# slowdowns that persist count and not a busy moment of the machine
+def confirm_regressions(cases, results, baseline, calibration, tolerance=regression_tolerance, noise_floor=noise_floor, retries=confirm_retries):
+    cases = {result_key(case[0]): case for case in cases}
+    regressions, missing = compare_to_baseline(results, baseline, tolerance, noise_floor, calibration)
+    for _ in range(retries):
+        if not regressions:
+            break
+        calibration = calibrate()
+        for result, _ in regressions:
+            result['seconds'] = min(result['seconds'], measure_case(cases[result_key(result)])['seconds'])
+        regressions, missing = compare_to_baseline(results, baseline, tolerance, noise_floor, calibration)
+    return regressions, missing
+
+# Run the suite, write the JSON report and fail (exit code 1) on regressions against a baseline report
+def run_suite(output, baseline=None, tolerance=regression_tolerance, quick=False, noise_floor=noise_floor):
+    options = {"sizes": suite_sizes[:2], "day_sizes": suite_day_sizes[:1]} if quick else {}
+    cases = suite_cases(**options)
+    calibration = calibrate()
+    results = [measure_case(case) for case in cases]
+    calibration = min(calibration, calibrate())
+    if baseline is not None:
+        with open(baseline) as file:
+            regressions, missing = confirm_regressions(cases, results, json.load(file), calibration, tolerance, noise_floor)
+    report = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "calibration": calibration,
+              "results": results}
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    for result in results:
+        parameters = ', '.join(f"{name}={value}" for name, value in result.items() if name not in ('name', 'seconds'))
+        print(f"{result['name']:>20} {result['seconds'] * 1000:12.3f} ms  {parameters}")
+
+    if baseline is not None:
+        for result in missing:
+            print(f"MISSING {result['name']} {dict(result_key(result))}: in the baseline but not measured")
+        for result, baseline_seconds in regressions:
+            print(f"REGRESSION {result['name']} {dict(result_key(result))}: {result['seconds'] * 1000:.3f} ms, baseline {baseline_seconds * 1000:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+def print_order_book():
+    print(f"{'participants':>12} {'order book (ms)':>16} {'legacy (ms)':>12} {'speedup':>8}")
+    for result in bench_order_book():
+        legacy = result['legacy']
+        legacy_text = f"{legacy * 1000:12.2f}" if legacy is not None else f"{'-':>12}"
+        speedup = f"{legacy / result['order_book']:8.1f}" if legacy is not None else f"{'-':>8}"
+        print(f"{result['participants']:>12} {result['order_book'] * 1000:16.2f} {legacy_text} {speedup}")
+
+# Fails (exit code 1) if any import takes longer than max_seconds
+def print_import_time(max_seconds=max_import_seconds):
+    slow = False
+    for result in bench_import_time():
+        print(f"{result['module']:>12} {result['import'] * 1000:10.1f} ms")
+        slow = slow or result['import'] > max_seconds
+    if slow:
+        print(f"Import time regression: limit is {max_seconds * 1000:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    parser.add_argument('benchmark', nargs='?', choices=['order_book', 'import_time', 'suite'], default='order_book')
+    parser.add_argument('--max-import-seconds', type=float, default=max_import_seconds)
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON report of the suite")
+    parser.add_argument('--baseline', help="JSON report of an earlier suite run to compare against")
+    parser.add_argument('--tolerance', type=float, default=regression_tolerance, help="allowed relative slowdown")
+    parser.add_argument('--noise-floor', type=float, default=noise_floor * 1000, help="slowdowns below this many ms are ignored")
+    parser.add_argument('--quick', action='store_true', help="smaller suite for quick checks")
+    args = parser.parse_args()
+    if args.benchmark == 'order_book':
+        print_order_book()
+    elif args.benchmark == 'import_time':
+        print_import_time(args.max_import_seconds)
+    else:
+        run_suite(args.output, args.baseline, args.tolerance, args.quick, args.noise_floor / 1000)
@@ -0,0 +1,163 @@
+import ast
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+default_max_bytes = 1 << 30
+versions = {}
+
+# Modules whose code changes simulation results: the modules of this directory that root imports,
+# directly or through other modules (also imports inside functions), so new modules are covered
+def source_files(root='sweep.py'):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    files = []
+    pending = [root]
+    while pending:
+        name = pending.pop()
+        if name in files:
+            continue
+        files.append(name)
+        with open(os.path.join(directory, name)) as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                modules = [node.module]
+            else:
+                continue
+            for module in modules:
+                path = module.split('.')[0] + '.py'
+                if os.path.exists(os.path.join(directory, path)):
+                    pending.append(path)
+    return sorted(files)
+
+# Hash of the source files (source_files() by default), computed once per process
+def code_version(files=None):
+    if files is None:
+        if None not in versions:
+            versions[None] = code_version(source_files())
+        return versions[None]
+    files = tuple(files)
+    if files not in versions:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in files:
+            digest.update(name.encode())
+            with open(os.path.join(directory, name), 'rb') as file:
+                digest.update(file.read())
+        versions[files] = digest.hexdigest()
+    return versions[files]
+
+# sha256 over the configuration (any JSON data), the bytes of the arrays and the code version
+def cache_key(config, arrays=(), version=None):
+    digest = hashlib.sha256()
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+    digest.update((version or code_version()).encode())
+    return digest.hexdigest()
+
+# Results stored by key in directory: key.json with the index dict and optionally key.npz with trade
+# log columns. Reading an entry touches its files, when the cache grows beyond max_bytes the least
+# recently used entries are deleted.
+class ResultCache:
+    def __init__(self, directory, max_bytes=default_max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key):
+        path = self.path(key, 'json')
+        try:
+            with open(path) as file:
+                result = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touch(key)
+        return result
+
+    def get_trades(self, key):
+        path = self.path(key, 'npz')
+        if not os.path.exists(path):
+            return None
+        self.touch(key)
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key, 'json'))
+
+    def touch(self, key):
+        for extension in ('json', 'npz'):
+            try:
+                os.utime(self.path(key, extension))
+            except FileNotFoundError:
+                pass
+
+    # Trades are a dict of columns, e.g. TradeLog.buffered(). The JSON file is written last, so an
+    # entry is only visible once it is complete.
+    def put(self, key, result, trades=None):
+        if trades is not None:
+            self.write(self.path(key, 'npz'), lambda file: np.savez_compressed(file, **trades))
+        self.write(self.path(key, 'json'), lambda file: file.write(json.dumps(result, default=float).encode()))
+        self.evict()
+
+    def write(self, path, write):
+        file = tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            with file:
+                write(file)
+            os.replace(file.name, path)
+        except BaseException:
+            os.unlink(file.name)
+            raise
+
+    def entries(self):
+        entries = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')) + glob.glob(os.path.join(self.directory, '*.npz')):
+            key = os.path.splitext(os.path.basename(path))[0]
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + status.st_size, max(used, status.st_mtime))
+        return entries
+
+    def size(self):
+        return sum(size for size, _ in self.entries().values())
+
+    # Delete least recently used entries until the cache fits into max_bytes
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda entry: entry[1][1]):
+            if total <= self.max_bytes:
+                break
+            for extension in ('json', 'npz'):
+                try:
+                    os.remove(self.path(key, extension))
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for key in self.entries():
+            for extension in ('json', 'npz'):
+                try:
+                    os.remove(self.path(key, extension))
+                except FileNotFoundError:
+                    pass
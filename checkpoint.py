@@ -0,0 +1,208 @@
+import json
+import os
+import tempfile
+import numpy as np
+from community import CommunityState
+from indexes import IndexAccumulator
+from tradelog import columns as trade_log_columns
+
+accumulator_fields = ['total_quantity', 'total_value', 'sum_price', 'sum_squared_price',
+                      'traditional_buyers', 'traditional_sellers', 'provider_buy', 'provider_sell']
+market_fields = ['provider_buy', 'provider_sell', 'traditional_buyers', 'traditional_sellers', 'current_round']
+
+# RNG states contain nested dicts, tuples and arrays, arrays are stored as lists with their dtype
+def to_json(value):
+    if isinstance(value, np.ndarray):
+        return {"array": value.tolist(), "dtype": str(value.dtype)}
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def from_json(value):
+    if isinstance(value, dict):
+        if set(value) == {"array", "dtype"}:
+            return np.array(value["array"], dtype=value["dtype"])
+        return {key: from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_json(item) for item in value]
+    return value
+
+# State of a np.random.Generator, or of the global np.random used when rng is None
+def rng_state(rng):
+    if rng is None:
+        return {"legacy": to_json(np.random.get_state())}
+    return {"generator": to_json(rng.bit_generator.state)}
+
+def set_rng_state(rng, state):
+    if rng is None:
+        np.random.set_state(tuple(from_json(state["legacy"])))
+    else:
+        rng.bit_generator.state = from_json(state["generator"])
+
+def participant_arrays(participants):
+    if isinstance(participants, CommunityState):
+        return {"ids": participants.ids, "demand": participants.demand, "supply": participants.supply, "cost": participants.cost,
+                "revenue": participants.revenue, "storage": participants.storage, "active": participants.active}
+    return {
+        "ids": [participant.id for participant in participants],
+        "demand": np.array([np.asarray(participant.energy_demand) for participant in participants], dtype=float),
+        "supply": np.array([np.asarray(participant.energy_supply) for participant in participants], dtype=float),
+        "cost": np.array([participant.cost for participant in participants], dtype=float),
+        "revenue": np.array([participant.revenue for participant in participants], dtype=float),
+        "storage": np.array([participant.get_storage() for participant in participants], dtype=float)
+    }
+
+# Profiles start_day builds each new day from. Profiles read from files (generator.ProfileView) are the same
+# in every process and not stored.
+def base_profiles(participants):
+    if isinstance(participants, CommunityState):
+        return {"demand": participants.base_demand, "supply": participants.base_supply}
+    if any(not isinstance(participant.load_profile, np.ndarray) for participant in participants):
+        return {}
+    return {
+        "demand": np.array([participant.load_profile for participant in participants], dtype=float),
+        "supply": np.array([participant.pv_profile if participant.pv else np.zeros_like(participant.load_profile)
+                            for participant in participants], dtype=float)
+    }
+
+# Battery parameters, they are not restored: a run only continues with the ones it was saved with
+def battery_arrays(participants):
+    if isinstance(participants, CommunityState):
+        fleet = participants.fleet
+        return {"capacity": participants.battery_capacity, "charge_rate": fleet.charge_rate, "discharge_rate": fleet.discharge_rate,
+                "efficiency": fleet.efficiency}
+    return {"capacity": np.array([participant.battery_capacity for participant in participants], dtype=float)}
+
+# Snapshot of participants (a list or CommunityState), RNG and optionally a market, the trades kept by
+# run_market and a trade log, taken at a slot or day boundary (position, e.g. {"time_slot": 11}).
+# Everything goes into one .npz file, the JSON part is stored as a string entry. The file is written
+# next to path and moved into place with os.replace, so a crash leaves either the old or the new snapshot.
+def save_checkpoint(path, participants, position, rng=None, config=None, market=None, trade_history=None, trade_log=None, **values):
+    state = participant_arrays(participants)
+    meta = {"position": position, "config": config, "ids": state.pop("ids"), "rng": rng_state(rng), "values": to_json(values)}
+    arrays = {f"participant_{name}": value for name, value in state.items()}
+    arrays.update({f"battery_{name}": value for name, value in battery_arrays(participants).items()})
+    arrays.update({f"profile_{name}": value for name, value in base_profiles(participants).items()})
+
+    if market is not None:
+        meta["market"] = {name: getattr(market, name) for name in market_fields}
+        meta["order_book"] = {"next_seq": market.order_book.next_seq, "partial_fills": market.order_book.partial_fills}
+        arrays["market_trade_history"] = np.array(market.trade_history, dtype=float)
+        slots = sorted(market.metrics.slots)
+        accumulators = [market.metrics.total] + [market.metrics.slots[time_slot] for time_slot in slots]
+        arrays["metrics_slots"] = np.array(slots, dtype=np.int64)
+        arrays["metrics_counts"] = np.array([accumulator.count for accumulator in accumulators], dtype=np.int64)
+        arrays["metrics_sums"] = np.array([[getattr(accumulator, name) for name in accumulator_fields] for accumulator in accumulators], dtype=float).reshape(-1, len(accumulator_fields))
+
+    if trade_history is not None:
+        arrays["trades_seller"] = np.array([trade[0] for trade in trade_history], dtype=str)
+        arrays["trades_buyer"] = np.array([trade[1] for trade in trade_history], dtype=str)
+        arrays["trades_quantity"] = np.array([trade[2] for trade in trade_history], dtype=float)
+        arrays["trades_price"] = np.array([trade[3] for trade in trade_history], dtype=float)
+
+    if trade_log is not None:
+        meta["trade_log"] = {"chunks": trade_log.chunks, "flushed": trade_log.flushed, "day": trade_log.day}
+        for name, column in trade_log.buffered().items():
+            arrays[f"trade_log_{name}"] = column
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file = tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False)
+    try:
+        with file:
+            np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+class Checkpoint:
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self.arrays = {name: data[name] for name in data.files if name != "meta"}
+        self.position = self.meta["position"]
+        self.values = from_json(self.meta["values"])
+
+    # Raise if the snapshot was taken for another configuration, community or battery parameters
+    def check(self, config, participants):
+        if self.meta["config"] != json.loads(json.dumps(config)):
+            raise ValueError(f"Checkpoint was written for {self.meta['config']}, not {config}")
+        ids = participants.ids if isinstance(participants, CommunityState) else [participant.id for participant in participants]
+        if self.meta["ids"] != list(ids):
+            raise ValueError("Checkpoint was written for different participants")
+        for name, value in battery_arrays(participants).items():
+            saved = self.arrays.get(f"battery_{name}")
+            if saved is not None and not np.array_equal(saved, value):
+                raise ValueError(f"Checkpoint was written with a different battery {name.replace('_', ' ')}")
+
+    # Balances, storage and the profiles of the current and of further days
+    def restore_participants(self, participants):
+        arrays = self.arrays
+        profiles = "profile_demand" in arrays
+        if isinstance(participants, CommunityState):
+            for name in ("demand", "supply", "cost", "revenue", "storage", "active"):
+                getattr(participants, name)[:] = arrays[f"participant_{name}"]
+            if profiles:
+                participants.base_demand[:] = arrays["profile_demand"]
+                participants.base_supply[:] = arrays["profile_supply"]
+            return
+        cost, revenue, storage = (arrays[f"participant_{name}"].tolist() for name in ("cost", "revenue", "storage"))
+        for i, participant in enumerate(participants):
+            for name in ("demand", "supply"):
+                profile = getattr(participant, f"energy_{name}")
+                if isinstance(profile, np.ndarray):
+                    profile[:] = arrays[f"participant_{name}"][i]
+                else:       # e.g. a generator.ProfileView, continues as a plain array
+                    setattr(participant, f"energy_{name}", arrays[f"participant_{name}"][i].copy())
+            participant.cost = cost[i]
+            participant.revenue = revenue[i]
+            participant._Participant__energy_storage = storage[i]
+            if profiles:
+                participant.load_profile = arrays["profile_demand"][i].copy()
+                if participant.pv:
+                    participant.pv_profile = arrays["profile_supply"][i].copy()
+
+    def restore_rng(self, rng=None):
+        set_rng_state(rng, self.meta["rng"])
+
+    # Totals, metrics and trade history of the market, its participants are restored separately
+    def restore_market(self, market):
+        for name, value in self.meta["market"].items():
+            setattr(market, name, value)
+        market.order_book.next_seq = self.meta["order_book"]["next_seq"]
+        market.order_book.partial_fills = self.meta["order_book"]["partial_fills"]
+        market.trade_history = self.arrays["market_trade_history"].tolist()
+        accumulators = []
+        for count, sums in zip(self.arrays["metrics_counts"].tolist(), self.arrays["metrics_sums"].tolist()):
+            accumulator = IndexAccumulator()
+            accumulator.count = count
+            for name, value in zip(accumulator_fields, sums):
+                setattr(accumulator, name, value)
+            accumulators.append(accumulator)
+        market.metrics.total = accumulators[0]
+        market.metrics.slots = dict(zip(self.arrays["metrics_slots"].tolist(), accumulators[1:]))
+
+    def trade_history(self):
+        arrays = self.arrays
+        return list(zip(arrays["trades_seller"].tolist(), arrays["trades_buyer"].tolist(),
+                        arrays["trades_quantity"].tolist(), arrays["trades_price"].tolist()))
+
+    # Chunks written after the snapshot are written again (with the same names) when the run continues
+    def restore_trade_log(self, trade_log):
+        state = self.meta["trade_log"]
+        trade_log.chunks, trade_log.flushed, trade_log.day = state["chunks"], state["flushed"], state["day"]
+        size = len(self.arrays["trade_log_price"])
+        trade_log.size = 0
+        trade_log.allocate(max(size, len(trade_log.data["price"])))
+        for name in trade_log_columns:
+            trade_log.data[name][:size] = self.arrays[f"trade_log_{name}"]
+        trade_log.size = size
+
+def load_checkpoint(path):
+    return Checkpoint(path) if os.path.exists(path) else None
@@ -0,0 +1,170 @@
+import numpy as np
+from battery import BatteryFleet, battery_policy
+from market import CDAMarket, Participant
+
+# Whole community kept as arrays: demand and supply are (participants x time slots),
+# battery storage, capacity, cost and revenue are one value per participant
+class CommunityState:
+    def __init__(self, ids, demand, supply, pv, battery_capacity, storage=None, cost=None, revenue=None):
+        num_participants = len(ids)
+        self.ids = list(ids)
+        self.demand = np.asarray(demand, dtype=float)
+        self.supply = np.asarray(supply, dtype=float)
+        self.pv = np.asarray(pv, dtype=bool)
+        self.battery_capacity = np.asarray(battery_capacity, dtype=float)
+        self.storage = np.zeros(num_participants) if storage is None else np.asarray(storage, dtype=float)
+        self.cost = np.zeros(num_participants) if cost is None else np.asarray(cost, dtype=float)
+        self.revenue = np.zeros(num_participants) if revenue is None else np.asarray(revenue, dtype=float)
+        self.active = np.ones(num_participants, dtype=bool)
+        self.base_demand = self.demand.copy()       # profiles at construction, used to start further days
+        self.base_supply = self.supply.copy()
+        self.fleet = BatteryFleet(self.battery_capacity, self.storage)      # rates and efficiency can be set on the fleet
+
+    # Copy existing participants into the arrays, including their current battery and balance
+    @classmethod
+    def from_participants(cls, participants):
+        return cls(
+            ids=[participant.id for participant in participants],
+            demand=np.array([participant.energy_demand for participant in participants], dtype=float),
+            supply=np.array([participant.energy_supply for participant in participants], dtype=float),
+            pv=[participant.pv for participant in participants],
+            battery_capacity=[participant.battery_capacity for participant in participants],
+            storage=[participant.get_storage() for participant in participants],
+            cost=[participant.cost for participant in participants],
+            revenue=[participant.revenue for participant in participants])
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Same as Participant.start_day for the whole community
+    def start_day(self, pv_scale=1):
+        self.demand[:] = self.base_demand
+        self.supply[self.pv] = np.round(self.base_supply[self.pv] * pv_scale, 3)
+
+    def views(self):
+        return [ParticipantView(self, index) for index in range(len(self.ids))]
+
+    # Append one participant, this reallocates the arrays so existing views have to be rebound
+    def append(self, participant):
+        self.ids.append(participant.id)
+        self.demand = np.vstack([self.demand, participant.energy_demand])
+        self.supply = np.vstack([self.supply, participant.energy_supply])
+        self.pv = np.append(self.pv, participant.pv)
+        self.battery_capacity = np.append(self.battery_capacity, participant.battery_capacity)
+        self.storage = np.append(self.storage, participant.get_storage())
+        self.cost = np.append(self.cost, participant.cost)
+        self.revenue = np.append(self.revenue, participant.revenue)
+        self.active = np.append(self.active, True)
+        self.base_demand = np.vstack([self.base_demand, participant.energy_demand])
+        self.base_supply = np.vstack([self.base_supply, participant.energy_supply])
+        self.fleet.bind(self.battery_capacity, self.storage)
+        return len(self.ids) - 1
+
+# Participant backed by one row of a CommunityState instead of its own arrays and scalars
+class ParticipantView(Participant):
+    def __init__(self, state, index):
+        self.state = state
+        self.index = index
+        self.id = state.ids[index]
+        self.pv = bool(state.pv[index])
+        self.bind()
+
+    def bind(self):
+        self.energy_demand = self.state.demand[self.index]
+        self.energy_supply = self.state.supply[self.index]
+
+    @property
+    def cost(self):
+        return self.state.cost[self.index]
+
+    @cost.setter
+    def cost(self, value):
+        self.state.cost[self.index] = value
+
+    @property
+    def revenue(self):
+        return self.state.revenue[self.index]
+
+    @revenue.setter
+    def revenue(self, value):
+        self.state.revenue[self.index] = value
+
+    @property
+    def battery_capacity(self):
+        return self.state.battery_capacity[self.index]
+
+    @battery_capacity.setter
+    def battery_capacity(self, value):
+        self.state.battery_capacity[self.index] = value
+
+    # Replaces the private storage attribute used by Participant.load_battery/withdraw_battery
+    @property
+    def _Participant__energy_storage(self):
+        return self.state.storage[self.index]
+
+    @_Participant__energy_storage.setter
+    def _Participant__energy_storage(self, value):
+        self.state.storage[self.index] = value
+
+# CDA market where balancing, traditional pricing and battery management run on the whole
+# community at once. Order collection, matching and clearing work on the participant views.
+# The battery option can also be a battery.DispatchPolicy, batteries are the state's BatteryFleet.
+class VectorizedCDAMarket(CDAMarket):
+    def __init__(self, participants, otc_contracts, min_price, max_price, rng=None):
+        if isinstance(participants, CommunityState):
+            self.state = participants
+        else:
+            self.state = CommunityState.from_participants(participants)
+        super().__init__(self.state.views(), otc_contracts, min_price, max_price, rng)
+        self.fleet = self.state.fleet
+        self.update_members()
+
+    def update_members(self):
+        self.members = np.flatnonzero(self.state.active)
+        self.prosumers = np.flatnonzero(self.state.active & self.state.pv)
+
+    def add_participant(self, participant):
+        if participant.id in self.participant_index:
+            raise ValueError(f"Participant {participant.id} is already part of the market")
+        index = self.state.append(participant)
+        for view in self.participants:
+            view.bind()
+        super().add_participant(ParticipantView(self.state, index))
+        self.update_members()
+
+    def remove_participant(self, participant_id):
+        participant = super().remove_participant(participant_id)
+        self.state.active[participant.index] = False
+        self.update_members()
+        return participant
+
+    def slot_arrays(self, time_slot):
+        members = self.members
+        return self.state.demand[members, time_slot], self.state.supply[members, time_slot], self.state.pv[members]
+
+    # Prosumers consume their energy first
+    def balance_prosumer_energy(self, time_slot):
+        demand = self.state.demand[:, time_slot]
+        supply = self.state.supply[:, time_slot]
+        net_energy = supply[self.prosumers] - demand[self.prosumers]
+        supply[self.prosumers] = np.maximum(net_energy, 0)
+        demand[self.prosumers] = np.maximum(-net_energy, 0)
+
+    def manage_battery_storage(self, time_slot, bat_strategy):
+        battery_policy(bat_strategy).before_trading(self, time_slot)
+
+    def store_unmatched(self, asks, bat_strategy):
+        if not asks:
+            return []
+        units = np.array([self.participant_index[order[0]].index for order in asks])
+        quantities = np.array([order[3] for order in asks], dtype=float)
+        return battery_policy(bat_strategy).after_trading(self, units, quantities, asks[0][4]).tolist()
+
+    def traditional_prices(self, time_slot):
+        members = self.members
+        net_energy = self.state.supply[members, time_slot] - self.state.demand[members, time_slot]
+        sellers = float(np.sum(net_energy[net_energy > 0])) * self.min_price
+        buyers = float(-np.sum(net_energy[net_energy < 0])) * self.max_price
+        self.traditional_sellers += sellers
+        self.traditional_buyers += buyers
+        self.metrics.add_traditional(time_slot, buyers, sellers)
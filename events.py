@@ -0,0 +1,114 @@
+import json
+import sys
+
+DEBUG = 10
+INFO = 20
+levels = {'debug': DEBUG, 'info': INFO}
+
+# Level of every event type and the names of the values it carries. Events are emitted as plain
+# tuples of these values, names are only attached (and text formatted) by the sinks that want them.
+event_types = {
+    'slot': (INFO, ('time_slot',)),
+    'otc': (INFO, ('seller', 'buyer', 'quantity', 'price', 'time_slot')),
+    'order': (DEBUG, ('participant', 'side', 'price', 'quantity', 'time_slot')),
+    'match': (DEBUG, ('seller', 'buyer', 'quantity', 'price', 'time_slot', 'round')),
+    'battery_load': (DEBUG, ('participant', 'excess', 'time_slot')),
+    'battery_withdraw': (DEBUG, ('participant', 'needed', 'withdrawn', 'time_slot')),
+    'provider': (DEBUG, ('participant', 'side', 'quantity', 'price', 'amount', 'time_slot')),
+}
+
+# Buffer of emitted events handed to the sinks in batches. wanted holds the event types at least one
+# sink is interested in, emitters check it first so unwanted events cost a set lookup and nothing else.
+class EventStream:
+    def __init__(self, sinks=(), buffer_size=4096):
+        self.sinks = []
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.wanted = frozenset()
+        for sink in sinks:
+            self.add_sink(sink)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.wanted = self.wanted | sink.wanted
+
+    def emit(self, event_type, *values):
+        self.buffer.append((event_type, values))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        records, self.buffer = self.buffer, []
+        for sink in self.sinks:
+            sink.write([record for record in records if record[0] in sink.wanted])
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+# Base sink: receives the event types of at least level, optionally only the given types
+class Sink:
+    def __init__(self, level=INFO, types=None):
+        level = levels.get(level, level)
+        self.wanted = frozenset(event_type for event_type, (event_level, _) in event_types.items()
+                                if event_level >= level and (types is None or event_type in types))
+
+    def write(self, records):
+        pass
+
+    def close(self):
+        pass
+
+def record_dict(event_type, values):
+    return {"event": event_type, **dict(zip(event_types[event_type][1], values))}
+
+# Keeps the events as dictionaries in memory
+class MemorySink(Sink):
+    def __init__(self, level=DEBUG, types=None):
+        super().__init__(level, types)
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(record_dict(event_type, values) for event_type, values in records)
+
+def json_value(value):
+    return value.item() if hasattr(value, 'item') else str(value)
+
+# One JSON object per line, to a path (opened for appending) or an open text file
+class JsonLinesSink(Sink):
+    def __init__(self, file, level=INFO, types=None):
+        super().__init__(level, types)
+        self.owned = isinstance(file, str)
+        self.file = open(file, 'a') if self.owned else file
+
+    def write(self, records):
+        self.file.writelines(json.dumps(record_dict(event_type, values), default=json_value) + '\n' for event_type, values in records)
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+messages = {
+    'slot': "Processing time slot {time_slot}...",
+    'otc': "OTC Contract executed: {seller} sells {quantity} kWh to {buyer} at {price}€ per unit.",
+    'order': "{participant} places {side} for {quantity} kWh at {price}€/kWh",
+    'match': "Matched order: {seller} sells {quantity} kWh to {buyer} at {price}€/kWh",
+    'battery_load': "Participant {participant} - Excess energy after loading battery: {excess} kWh",
+    'battery_withdraw': "Participant {participant} - Additional energy needed after battery withdrawal: {needed} kWh",
+    'provider': "Unmatched {side} for {participant} cleared with provider: {quantity} kWh at {price}€/kWh for {amount}€",
+}
+
+# Readable lines like the former debug prints, to stdout by default
+class PrintSink(Sink):
+    def __init__(self, level=DEBUG, types=None, file=None):
+        super().__init__(level, types)
+        self.file = file
+
+    def write(self, records):
+        file = self.file or sys.stdout
+        for event_type, values in records:
+            print(messages[event_type].format(**dict(zip(event_types[event_type][1], values))), file=file)
@@ -0,0 +1,320 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+import numpy as np
+import simulation
+from market import CDAMarket
+from mechanisms import ContinuousDoubleAuction
+
+# Real-time gateway between a market and external trading agents. Agents connect over TCP (one JSON
+# object per line) or in-process (connect_local) and identify as a participant. Every round each agent
+# gets its demand, supply and the top of the book, orders that arrive before the round deadline are put
+# into the order book in one batch and the matches plus a book snapshot are broadcast to everyone.
+#
+# agent -> gateway: {"type": "hello", "participant": "C1"}
+#                   {"type": "order", "time_slot": 0, "round": 0, "bid_price": .., "bid_quantity": .., "ask_price": .., "ask_quantity": ..}
+# gateway -> agent: {"type": "welcome", "participant": "C1", "time_slots": 96, "rounds": 15, "min_price": .., "max_price": ..}
+#                   {"type": "round", "time_slot": 0, "round": 0, "deadline": 1.0, "demand": .., "supply": .., "best_bid": .., "best_ask": ..}
+#                   {"type": "result", "time_slot": 0, "round": 0, "matches": [[seller, buyer, quantity, price], ...], "book": {...}}
+#                   {"type": "end"} or {"type": "error", "message": ..}
+
+def encode(message):
+    return (json.dumps(message) + '\n').encode()
+
+class StreamConnection:
+    def __init__(self, writer):
+        self.writer = writer
+
+    def send(self, data):
+        self.writer.write(data)
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    def close(self):
+        self.writer.close()
+
+# In-process agent: messages from the gateway arrive decoded in inbox, orders go straight to the gateway
+class LocalConnection:
+    def __init__(self, gateway, participant_id):
+        self.gateway = gateway
+        self.participant_id = participant_id
+        self.inbox = asyncio.Queue()
+
+    def send(self, data):
+        self.inbox.put_nowait(json.loads(data))
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.gateway.disconnect(self.participant_id, self)
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    def submit(self, time_slot, round, bid_price=0, bid_quantity=0, ask_price=0, ask_quantity=0):
+        self.gateway.receive(self.participant_id, {"type": "order", "time_slot": time_slot, "round": round, "bid_price": bid_price,
+                                                   "bid_quantity": bid_quantity, "ask_price": ask_price, "ask_quantity": ask_quantity})
+
+class MarketGateway:
+    def __init__(self, market, battery='CDA_bat', rounds=15, round_seconds=1.0, close_early=True, mechanism=None):
+        self.market = market
+        self.battery = battery
+        self.mechanism = ContinuousDoubleAuction() if mechanism is None else mechanism
+        self.rounds = self.mechanism.rounds(rounds)
+        self.round_seconds = round_seconds
+        self.close_early = close_early      # end a round as soon as every connected agent has sent its order
+        self.connections = {}
+        self.pending = {}
+        self.round_key = None
+        self.submitted = None
+        self.connected = None
+        self.stats = {"orders": 0, "late": 0, "rejected": 0, "rounds": 0, "matches": 0}
+
+    def time_slots(self):
+        return len(self.market.participants[0].energy_demand) if self.market.participants else 0
+
+    def welcome(self, participant_id):
+        return encode({"type": "welcome", "participant": participant_id, "time_slots": self.time_slots(), "rounds": self.rounds,
+                       "min_price": self.market.min_price, "max_price": self.market.max_price})
+
+    def connect(self, participant_id, connection):
+        if participant_id not in self.market.participant_index:
+            raise ValueError(f"Unknown participant {participant_id}")
+        if participant_id in self.connections:
+            raise ValueError(f"Participant {participant_id} is already connected")
+        self.connections[participant_id] = connection
+        connection.send(self.welcome(participant_id))
+        if self.connected is not None:
+            self.connected.set()
+
+    def disconnect(self, participant_id, connection):
+        if self.connections.get(participant_id) is connection:
+            del self.connections[participant_id]
+
+    def connect_local(self, participant_id):
+        connection = LocalConnection(self, participant_id)
+        self.connect(participant_id, connection)
+        return connection
+
+    async def serve(self, host='127.0.0.1', port=0, backlog=4096):
+        return await asyncio.start_server(self.handle_client, host, port, backlog=backlog)
+
+    async def handle_client(self, reader, writer):
+        connection = StreamConnection(writer)
+        participant_id = None
+        try:
+            hello = json.loads(await reader.readline() or 'null')
+            participant_id = hello.get('participant') if isinstance(hello, dict) else None
+            self.connect(participant_id, connection)
+            await connection.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    self.receive(participant_id, json.loads(line))
+                except ValueError:
+                    self.stats["rejected"] += 1
+        except ValueError as error:
+            connection.send(encode({"type": "error", "message": str(error)}))
+            await connection.drain()
+            participant_id = None
+        except ConnectionError:
+            pass
+        finally:
+            if participant_id is not None:
+                self.disconnect(participant_id, connection)
+            writer.close()
+
+    # Keep the latest order of a participant for the open round, orders for other rounds are late
+    def receive(self, participant_id, message):
+        if not isinstance(message, dict) or message.get('type') != 'order':
+            self.stats["rejected"] += 1
+            return
+        if (message.get('time_slot'), message.get('round')) != self.round_key:
+            self.stats["late"] += 1
+            return
+        self.pending[participant_id] = message
+        if self.close_early and len(self.pending) >= len(self.connections):
+            self.submitted.set()
+
+    async def broadcast(self, data):
+        for connection in list(self.connections.values()):
+            connection.send(data)
+        await asyncio.gather(*(connection.drain() for connection in list(self.connections.values())))
+
+    # Open a round, wait for the orders until the deadline and place them like collect_orders does:
+    # the book only holds the orders of this round, quantities are limited to the participant's
+    # demand and supply and prices to the market's price range
+    async def collect(self, time_slot, round):
+        market = self.market
+        book = market.book_summary()
+        self.pending = {}
+        self.round_key = (time_slot, round)
+        self.submitted = asyncio.Event()
+        for participant_id, connection in list(self.connections.items()):
+            participant = market.participant_index[participant_id]
+            connection.send(encode({"type": "round", "time_slot": time_slot, "round": round, "deadline": self.round_seconds,
+                                    "demand": float(participant.energy_demand[time_slot]), "supply": float(participant.energy_supply[time_slot]),
+                                    "best_bid": book.best_bid, "best_ask": book.best_ask}))
+        await asyncio.gather(*(connection.drain() for connection in list(self.connections.values())))
+        if self.connections:
+            try:
+                await asyncio.wait_for(self.submitted.wait(), self.round_seconds)
+            except asyncio.TimeoutError:
+                pass
+        self.round_key = None
+
+        market.current_round = round
+        market.previous_order_book = list(market.order_book)
+        market.order_book.clear()
+        for participant_id, order in self.pending.items():
+            participant = market.participant_index.get(participant_id)
+            if participant is None:
+                continue
+            try:
+                bid_price, bid_quantity, ask_price, ask_quantity = (float(order.get(name, 0)) for name in ('bid_price', 'bid_quantity', 'ask_price', 'ask_quantity'))
+            except (TypeError, ValueError):
+                self.stats["rejected"] += 1
+                continue
+            if not all(math.isfinite(value) for value in (bid_price, bid_quantity, ask_price, ask_quantity)):
+                self.stats["rejected"] += 1     # NaN (accepted by json.loads) would survive the clamping below
+                continue
+            bid_quantity = min(max(bid_quantity, 0), participant.energy_demand[time_slot])
+            ask_quantity = min(max(ask_quantity, 0), participant.energy_supply[time_slot]) if participant.pv else 0
+            bid_price = min(max(bid_price, market.min_price), market.max_price)
+            ask_price = min(max(ask_price, market.min_price), market.max_price)
+            market.place_orders(participant_id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot)
+        self.stats["orders"] += len(self.pending)
+        self.stats["rounds"] += 1
+
+    def book_snapshot(self, depth=5):
+        bids = sorted((order for order in self.market.order_book if order[1] == 'bid'), key=lambda order: -order[2])[:depth]
+        asks = sorted((order for order in self.market.order_book if order[1] == 'ask'), key=lambda order: order[2])[:depth]
+        return {"bids": [[float(order[2]), float(order[3])] for order in bids], "asks": [[float(order[2]), float(order[3])] for order in asks]}
+
+    # Run the day with the same phases as simulation.run_market, orders come from the connected agents.
+    # wait_for agents are awaited (at most connect_timeout seconds) before the first slot, slots start <= t < end are traded.
+    async def run(self, wait_for=0, connect_timeout=60, start=0, end=None):
+        market = self.market
+        self.connected = asyncio.Event()
+        started = time.monotonic()
+        while len(self.connections) < wait_for and time.monotonic() - started < connect_timeout:
+            self.connected.clear()
+            try:
+                await asyncio.wait_for(self.connected.wait(), connect_timeout - (time.monotonic() - started))
+            except asyncio.TimeoutError:
+                break
+
+        for time_slot in range(start, self.time_slots() if end is None else end):
+            market.balance_prosumer_energy(time_slot)
+            market.traditional_prices(time_slot)
+            if self.battery != 'no_bat':
+                market.manage_battery_storage(time_slot, self.battery)
+            market.apply_otc_contracts(time_slot)
+            for round in range(self.rounds):
+                await self.collect(time_slot, round)
+                trades = self.mechanism.match(market, time_slot)
+                self.stats["matches"] += len(trades)
+                await self.broadcast(encode({"type": "result", "time_slot": time_slot, "round": round,
+                                             "matches": [[seller, buyer, float(quantity), float(price)] for seller, buyer, quantity, price in trades],
+                                             "book": self.book_snapshot()}))
+            market.clear_market(self.battery)
+        market.events.flush()
+        await self.broadcast(encode({"type": "end"}))
+        return market
+
+# Zero-intelligence agent over TCP, used to load test the gateway
+async def zi_agent(host, port, participant_id, seed=None):
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(encode({"type": "hello", "participant": participant_id}))
+    orders = 0
+    try:
+        welcome = json.loads(await reader.readline())
+        if welcome.get('type') != 'welcome':
+            return 0
+        min_price, max_price = welcome['min_price'], welcome['max_price']
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message['type'] == 'end':
+                break
+            if message['type'] == 'round':
+                writer.write(encode({"type": "order", "time_slot": message['time_slot'], "round": message['round'],
+                                     "bid_price": rng.uniform(min_price, max_price), "bid_quantity": message['demand'],
+                                     "ask_price": rng.uniform(min_price, max_price), "ask_quantity": message['supply']}))
+                await writer.drain()
+                orders += 1
+    finally:
+        writer.close()
+    return orders
+
+# Serve a generated community and connect one ZI agent per participant from the same process
+async def load_test(num_consumers=1000, num_prosumers=1000, battery='CDA_bat', start=48, time_slots=2, rounds=15, round_seconds=1.0, host='127.0.0.1', seed=0):
+    np.random.seed(seed)
+    participants = simulation.initialize_participants(num_consumers, num_prosumers)
+    market = CDAMarket(participants, simulation.otc_contracts, simulation.min_price, simulation.max_price)
+    gateway = MarketGateway(market, battery, rounds, round_seconds)
+    server = await gateway.serve(host)
+    port = server.sockets[0].getsockname()[1]
+    agents = [asyncio.ensure_future(zi_agent(host, port, participant.id, seed + i)) for i, participant in enumerate(participants)]
+    started = time.perf_counter()
+    await gateway.run(wait_for=len(participants), start=start, end=start + time_slots)
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*agents)
+    server.close()
+    await server.wait_closed()
+    return {"agents": len(participants), "time_slots": time_slots, "seconds": elapsed,
+            "round_seconds": elapsed / max(gateway.stats["rounds"], 1), **gateway.stats}
+
+# Raise the open file limit to the hard limit, every agent connection needs a descriptor (two in a load test)
+def raise_file_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+async def serve_day(host, port, battery, rounds, round_seconds, wait_for):
+    market = CDAMarket(simulation.initialize_participants(), simulation.otc_contracts, simulation.min_price, simulation.max_price)
+    gateway = MarketGateway(market, battery, rounds, round_seconds)
+    server = await gateway.serve(host, port)
+    print(f"Gateway listening on {host}:{server.sockets[0].getsockname()[1]}, waiting for {wait_for} agents")
+    await gateway.run(wait_for=wait_for)
+    server.close()
+    print(simulation.market_indexes(market), gateway.stats)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Real-time market gateway for external agents")
+    parser.add_argument('mode', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--battery', choices=['CDA_bat', 'bat_CDA', 'no_bat'], default='CDA_bat')
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--round-seconds', type=float, default=1.0, help="deadline of a round, 60 is wall-clock speed")
+    parser.add_argument('--wait-for', type=int, default=1, help="agents to wait for before the first slot (serve)")
+    parser.add_argument('--agents', type=int, default=2000, help="agents of the load test, half of them prosumers")
+    parser.add_argument('--start', type=int, default=48, help="first time slot of the load test")
+    parser.add_argument('--slots', type=int, default=2, help="time slots of the load test")
+    args = parser.parse_args(argv)
+    raise_file_limit()
+    if args.mode == 'serve':
+        asyncio.run(serve_day(args.host, args.port, args.battery, args.rounds, args.round_seconds, args.wait_for))
+    else:
+        result = asyncio.run(load_test(args.agents - args.agents // 2, args.agents // 2, args.battery, args.start, args.slots, args.rounds, args.round_seconds, args.host))
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
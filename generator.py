@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import numpy as np
+import loadProfiles
+from market import Participant
+
+# Read-only row of the profile store seen through a household scale. The market only ever changes the
+# slot it is trading, so instead of copying the whole row a view keeps a private value for the last
+# written slot. Writing another slot drops that value, earlier slots read from the store again.
+class ProfileView:
+    __slots__ = ('base', 'scale', 'day_scale', 'slot', 'value')
+
+    def __init__(self, base, scale=1.0):
+        self.base = base
+        self.scale = scale
+        self.day_scale = 1
+        self.slot = -1
+        self.value = 0
+
+    def __len__(self):
+        return len(self.base)
+
+    def __getitem__(self, time_slot):
+        if time_slot == self.slot:
+            return self.value
+        return np.round(self.base[time_slot] * (self.scale * self.day_scale), 3)
+
+    def __setitem__(self, time_slot, value):
+        self.slot = time_slot
+        self.value = value
+
+    def __array__(self, dtype=None, copy=None):
+        profile = np.round(np.asarray(self.base) * (self.scale * self.day_scale), 3)
+        if self.slot >= 0:
+            profile[self.slot] = self.value
+        return profile if dtype is None else profile.astype(dtype)
+
+    # Start a new day: forget the private slot and scale the profile (weather for pv rows)
+    def reset(self, day_scale=1):
+        self.day_scale = day_scale
+        self.slot = -1
+        self.value = 0
+
+# Vary a power profile (W): random scaling, a time shift of whole slots and multiplicative noise
+def vary_profile(template, rng, scale_range, max_shift, noise):
+    profile = np.roll(template, rng.integers(-max_shift, max_shift + 1)) * rng.uniform(*scale_range)
+    profile = profile * (1 + noise * rng.standard_normal(len(template)))
+    return np.clip(profile, 0, None)
+
+# Write num_load_profiles load and num_pv_profiles pv profiles (kWh per slot) derived from the L1/L2 and G1
+# templates as .npy files to directory, plus the assignment of num_households households to them.
+# Memory of the store grows with the number of distinct profiles, households only store indices.
+def generate_community(directory, num_households, prosumer_ratio=0.5, num_load_profiles=256, num_pv_profiles=32,
+                       time_slots=loadProfiles.time_slots, battery_capacity=5, household_spread=0.1, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    provider = loadProfiles.ProfileProvider(time_slots, rng=rng)
+    hours = 24 / time_slots
+    max_shift = time_slots // 24        # up to one hour earlier or later
+
+    load = np.lib.format.open_memmap(os.path.join(directory, 'load.npy'), mode='w+', dtype=np.float64, shape=(num_load_profiles, time_slots))
+    templates = [provider.L1_profile, provider.L2_profile]
+    for i in range(num_load_profiles):
+        load[i] = loadProfiles.power_to_kwh(vary_profile(templates[i % 2], rng, (0.75, 1.5), max_shift, 0.05), hours)
+    load.flush()
+
+    pv = np.lib.format.open_memmap(os.path.join(directory, 'pv.npy'), mode='w+', dtype=np.float64, shape=(num_pv_profiles, time_slots))
+    for i in range(num_pv_profiles):
+        pv[i] = loadProfiles.power_to_kwh(vary_profile(provider.pv_power_profile, rng, (0.6, 1.2), max_shift, 0.02), hours)
+    pv.flush()
+
+    num_prosumers = int(round(num_households * prosumer_ratio))
+    pv_index = np.full(num_households, -1, dtype=np.int32)          # consumers first, then prosumers
+    pv_index[num_households - num_prosumers:] = rng.integers(0, num_pv_profiles, num_prosumers)
+    np.savez(os.path.join(directory, 'households.npz'),
+             load_index=rng.integers(0, num_load_profiles, num_households).astype(np.int32),
+             pv_index=pv_index,
+             scale=rng.uniform(1 - household_spread, 1 + household_spread, num_households).astype(np.float32))
+    with open(os.path.join(directory, 'community.json'), 'w') as file:
+        json.dump({"households": num_households, "prosumers": num_prosumers, "load_profiles": num_load_profiles,
+                   "pv_profiles": num_pv_profiles, "time_slots": time_slots, "battery_capacity": battery_capacity, "seed": seed}, file)
+    return Community(directory)
+
+# Community stored by generate_community. The profile files are memory-mapped read-only and shared by
+# every participant through ProfileView rows, nothing is copied per household.
+class Community:
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'community.json')) as file:
+            self.config = json.load(file)
+        self.load = np.load(os.path.join(directory, 'load.npy'), mmap_mode='r')
+        self.pv = np.load(os.path.join(directory, 'pv.npy'), mmap_mode='r')
+        households = np.load(os.path.join(directory, 'households.npz'))
+        self.load_index = households['load_index']
+        self.pv_index = households['pv_index']
+        self.scale = households['scale']
+        self.zeros = np.zeros(self.config['time_slots'])
+        self.zeros.flags.writeable = False
+        self.num_consumers = int(np.count_nonzero(self.pv_index < 0))
+
+    def __len__(self):
+        return len(self.load_index)
+
+    # Same ids as simulation.initialize_participants: C1..Cn for consumers, P1..Pm for prosumers
+    def participant(self, i):
+        scale = float(self.scale[i])
+        load_profile = ProfileView(self.load[self.load_index[i]], scale)
+        if self.pv_index[i] < 0:
+            return Participant(id=f'C{i + 1}', load_profile=load_profile, pv_profile=ProfileView(self.zeros), copy=False)
+        pv_profile = ProfileView(self.pv[self.pv_index[i]], scale)
+        return Participant(id=f'P{i - self.num_consumers + 1}', load_profile=load_profile, pv=True, pv_profile=pv_profile,
+                           battery_capacity=self.config['battery_capacity'], copy=False)
+
+    def participants(self):
+        return [self.participant(i) for i in range(len(self))]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic community with an on-disk profile store")
+    parser.add_argument('directory')
+    parser.add_argument('--households', type=int, default=10000)
+    parser.add_argument('--prosumer-ratio', type=float, default=0.5)
+    parser.add_argument('--load-profiles', type=int, default=256)
+    parser.add_argument('--pv-profiles', type=int, default=32)
+    parser.add_argument('--battery-capacity', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    community = generate_community(args.directory, args.households, args.prosumer_ratio, args.load_profiles, args.pv_profiles,
+                                   battery_capacity=args.battery_capacity, seed=args.seed)
+    print(f"Generated {len(community)} households ({community.config['prosumers']} prosumers) in {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,53 +1,150 @@
 import numpy as np
 
+index_names = ['average_price', 'price_dispersion', 'payment_reduction', 'income_increase', 'community_welfare']
+
+# Student t quantile of the two-sided confidence interval for a sample of count values, count - 1 degrees of
+# freedom (the normal quantile is too narrow for a handful of replications). Used by montecarlo and report.
+def t_quantile(count, confidence=0.95):
+    from scipy.stats import t
+    return float(t.ppf(0.5 + confidence / 2, count - 1))
+
+# Running sums over trades and provider/traditional payments, enough to evaluate every index in O(1)
+class IndexAccumulator:
+    def __init__(self):
+        self.count = 0
+        self.total_quantity = 0
+        self.total_value = 0
+        self.sum_price = 0
+        self.sum_squared_price = 0
+        self.traditional_buyers = 0
+        self.traditional_sellers = 0
+        self.provider_buy = 0
+        self.provider_sell = 0
+
+    @classmethod
+    def from_trades(cls, trades):
+        accumulator = cls()
+        for trade in trades:
+            accumulator.add_trade(trade[2], trade[3])
+        return accumulator
+
+    def add_trade(self, quantity, price):
+        self.count += 1
+        self.total_quantity += quantity
+        self.total_value += quantity * price
+        self.sum_price += price
+        self.sum_squared_price += price * price
+
+    def average_price(self):
+        return self.total_value / self.total_quantity if self.total_quantity > 0 else 0
+
+    # mean squared deviation of the trade prices from average_price (the quantity weighted average by default)
+    def price_dispersion(self, average_price=None):
+        if self.count == 0:
+            return 0
+        if average_price is None:
+            average_price = self.average_price()
+        variance = (self.sum_squared_price - 2 * average_price * self.sum_price) / self.count + average_price ** 2
+        return np.sqrt(max(variance, 0))
+
+    def payment_reduction(self):
+        original_total = self.traditional_buyers
+        after_total = self.total_value + self.provider_buy
+        return ((original_total - after_total) / original_total) * 100 if original_total > 0 else 0
+
+    def income_increase(self):
+        original_total_sellers = self.traditional_sellers
+        after_total_sellers = self.total_value + self.provider_sell
+        return ((after_total_sellers - original_total_sellers) / original_total_sellers) * 100 if original_total_sellers > 0 else 0
+
+    def community_welfare(self):
+        original_net = self.traditional_buyers - self.traditional_sellers
+        after_net = (self.total_value + self.provider_buy) - (self.total_value + self.provider_sell)
+        if original_net != 0:
+            return abs(((original_net - after_net) / original_net)) * 100
+        else:
+            return 0
+
+    def indexes(self):
+        return {
+            "average_price": self.average_price(),
+            "price_dispersion": self.price_dispersion(),
+            "payment_reduction": self.payment_reduction(),
+            "income_increase": self.income_increase(),
+            "community_welfare": self.community_welfare()
+        }
+
+# Index accumulators for the whole run and for every time slot, fed by the market as trading happens
+class MarketMetrics:
+    def __init__(self):
+        self.total = IndexAccumulator()
+        self.slots = {}
+
+    def slot(self, time_slot):
+        if time_slot not in self.slots:
+            self.slots[time_slot] = IndexAccumulator()
+        return self.slots[time_slot]
+
+    def add_trade(self, time_slot, quantity, price):
+        self.total.add_trade(quantity, price)
+        self.slot(time_slot).add_trade(quantity, price)
+
+    def add_traditional(self, time_slot, buyers, sellers):
+        for accumulator in (self.total, self.slot(time_slot)):
+            accumulator.traditional_buyers += buyers
+            accumulator.traditional_sellers += sellers
+
+    def add_provider(self, time_slot, buy, sell):
+        for accumulator in (self.total, self.slot(time_slot)):
+            accumulator.provider_buy += buy
+            accumulator.provider_sell += sell
+
+    def indexes(self, time_slot=None):
+        if time_slot is None:
+            return self.total.indexes()
+        return self.slot(time_slot).indexes()
+
 # calculate the average price of trades
 def calculate_average_price(trades):
     if not trades:
         return 0
-    total_quantity = sum(trade[2] for trade in trades)
-    total_value = sum(trade[2] * trade[3] for trade in trades)
-    return total_value / total_quantity if total_quantity > 0 else 0
+    return IndexAccumulator.from_trades(trades).average_price()
 
 # calculate the standard deviation of trade prices from their average
 def calculate_price_dispersion(trades, average_price):
     if not trades:
         return 0
-    n = len(trades)
-    variance = sum((trade[3] - average_price) ** 2 for trade in trades) / n
-    return np.sqrt(variance)
+    return IndexAccumulator.from_trades(trades).price_dispersion(average_price)
 
 # calculate the reduction in payment due to trading at market prices compared to the fallback buying price
-def calculate_payment_reduction(trades, traditional_buyers, provider_buy):
-    original_total = traditional_buyers
-    after_total = sum(trade[2] * trade[3] for trade in trades) + provider_buy
-    print("Original Total (traditional_buyers):", original_total)
-    print("Provider Buy:", provider_buy)
-    print("Total After Trades (trades sum + provider_buy):", after_total)
+def calculate_payment_reduction(trades, traditional_buyers, provider_buy, printer=False):
+    accumulator = IndexAccumulator.from_trades(trades)
+    accumulator.traditional_buyers = traditional_buyers
+    accumulator.provider_buy = provider_buy
+    if printer:
+        print("Original Total (traditional_buyers):", traditional_buyers)
+        print("Provider Buy:", provider_buy)
+        print("Total After Trades (trades sum + provider_buy):", accumulator.total_value + provider_buy)
 
-    return ((original_total - after_total) / original_total) * 100 if original_total > 0 else 0
+    return accumulator.payment_reduction()
 
 # calculate the increase in income due to trading at market prices compared to the fallback selling price
-def calculate_income_increase(trades, traditional_sellers, provider_sell):
-    original_total_sellers = traditional_sellers
-    after_total_sellers = sum(trade[2] * trade[3] for trade in trades) + provider_sell
-    print("Original Total Sellers:", original_total_sellers)
-    print("Provider Sells:", provider_sell)
-    print("After Total Sellers:", after_total_sellers)
+def calculate_income_increase(trades, traditional_sellers, provider_sell, printer=False):
+    accumulator = IndexAccumulator.from_trades(trades)
+    accumulator.traditional_sellers = traditional_sellers
+    accumulator.provider_sell = provider_sell
+    if printer:
+        print("Original Total Sellers:", traditional_sellers)
+        print("Provider Sells:", provider_sell)
+        print("After Total Sellers:", accumulator.total_value + provider_sell)
 
-    return ((after_total_sellers - original_total_sellers) / original_total_sellers) * 100 if original_total_sellers > 0 else 0
+    return accumulator.income_increase()
 
 # calculate the overall community welfare change considering both matched and unmatched trades
 def calculate_community_welfare(trades, traditional_sellers, traditional_buyers, provider_buy, provider_sell):
-    buyers_original = traditional_buyers
-    buyers_after = sum(trade[2] * trade[3] for trade in trades) + provider_buy
-
-    sellers_original = traditional_sellers
-    sellers_after = sum(trade[2] * trade[3] for trade in trades) + provider_sell
-
-    original_net = buyers_original - sellers_original
-    after_net = buyers_after - sellers_after
-    if original_net != 0:
-        return abs(((original_net - after_net) / original_net)) * 100
-    else:
-        return 0
-
+    accumulator = IndexAccumulator.from_trades(trades)
+    accumulator.traditional_sellers = traditional_sellers
+    accumulator.traditional_buyers = traditional_buyers
+    accumulator.provider_buy = provider_buy
+    accumulator.provider_sell = provider_sell
+    return accumulator.community_welfare()
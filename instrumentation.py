@@ -0,0 +1,101 @@
+import cProfile
+import io
+import pstats
+import time
+
+phases = ['balance', 'traditional', 'battery', 'otc', 'collect', 'match', 'clear']
+counters = ['orders', 'matches', 'partial_fills']
+
+# Stand-in used by run_market when no instrumentation is requested, every hook is a cheap no-op
+class NullInstrumentation:
+    def now(self):
+        return 0
+
+    def lap(self, phase, time_slot, started, round=None):
+        return 0
+
+    def count_round(self, time_slot, round, orders, matches, partial_fills):
+        pass
+
+    def start_slot(self, time_slot):
+        pass
+
+    def end_slot(self, time_slot):
+        pass
+
+null_instrumentation = NullInstrumentation()
+
+# Timers per phase and counters for orders, matches and partial fills, per slot and per round.
+# With profile_slot set, that slot runs under cProfile and its statistics are part of the report.
+class Instrumentation:
+    def __init__(self, profile_slot=None, profile_lines=25):
+        self.phase_seconds = {phase: 0.0 for phase in phases}
+        self.totals = {counter: 0 for counter in counters}
+        self.slots = {}         # time_slot -> {phase/counter: value}
+        self.rounds = {}        # (time_slot, round) -> {phase/counter: value}
+        self.profile_slot = profile_slot
+        self.profile_lines = profile_lines
+        self.profiler = None
+        self.profile = None
+
+    def now(self):
+        return time.perf_counter()
+
+    # Add the time since started to phase and return the current time as start of the next phase
+    def lap(self, phase, time_slot, started, round=None):
+        now = time.perf_counter()
+        elapsed = now - started
+        self.phase_seconds[phase] += elapsed
+        slot = self.slot(time_slot)
+        slot[phase] = slot.get(phase, 0.0) + elapsed
+        if round is not None:
+            record = self.rounds.setdefault((time_slot, round), {})
+            record[phase] = record.get(phase, 0.0) + elapsed
+        return now
+
+    def count_round(self, time_slot, round, orders, matches, partial_fills):
+        slot = self.slot(time_slot)
+        record = self.rounds.setdefault((time_slot, round), {})
+        for counter, value in zip(counters, (orders, matches, partial_fills)):
+            self.totals[counter] += value
+            slot[counter] = slot.get(counter, 0) + value
+            record[counter] = value
+
+    def slot(self, time_slot):
+        if time_slot not in self.slots:
+            self.slots[time_slot] = {}
+        return self.slots[time_slot]
+
+    def start_slot(self, time_slot):
+        if time_slot == self.profile_slot:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def end_slot(self, time_slot):
+        if self.profiler is not None and time_slot == self.profile_slot:
+            self.profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(self.profile_lines)
+            self.profile = output.getvalue()
+            self.profiler = None
+
+    def report(self):
+        total = sum(self.phase_seconds.values())
+        return {
+            "total_seconds": total,
+            "phases": {phase: {"seconds": seconds, "share": seconds / total if total > 0 else 0}
+                       for phase, seconds in self.phase_seconds.items()},
+            "counters": dict(self.totals),
+            "slots": [{"time_slot": time_slot, **values} for time_slot, values in sorted(self.slots.items())],
+            "rounds": [{"time_slot": time_slot, "round": round, **values} for (time_slot, round), values in sorted(self.rounds.items())],
+            "profile": self.profile
+        }
+
+    # Short human readable summary of the phase times and counters
+    def summary(self):
+        report = self.report()
+        lines = [f"{'phase':>12} {'seconds':>10} {'share':>7}"]
+        for phase, values in report['phases'].items():
+            lines.append(f"{phase:>12} {values['seconds']:10.4f} {values['share'] * 100:6.1f}%")
+        lines.append(', '.join(f"{counter}={value}" for counter, value in report['counters'].items()))
+        return '\n'.join(lines)
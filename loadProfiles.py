@@ -1,11 +1,9 @@
 import numpy as np
-from scipy.interpolate import CubicSpline
-import matplotlib.pyplot as plt
+from functools import cached_property
 
 
 # Time windows
 time_slots = 96  # 96 15-minute intervals per day
-time = np.linspace(0, 24, time_slots + 1)[:-1]  # Creates 96 points over 24 hours
 days = 14
 alpha = np.ones(days + 1)
 
@@ -16,86 +14,146 @@ time_points = np.arange(25)
 L1_values = np.array([500, 425, 375, 350, 350, 350, 375, 500, 600, 575, 525, 500, 515, 515, 515, 550, 600, 700, 915, 1010, 975, 915, 850, 675, 475])
 L2_values = np.array([400, 350, 350, 325, 300, 300, 325, 400, 475, 550, 625, 675, 725, 760, 740, 685, 650, 700, 825, 850, 850, 800, 740, 575, 400])
 
-# Create cubic splines
-cs_L1 = CubicSpline(time_points, L1_values)
-cs_L2 = CubicSpline(time_points, L2_values)
-
-# Evaluate the cubic splines at the time array
-L1_profile = cs_L1(time)
-L2_profile = cs_L2(time)
-
-# Deviation profiles
-L1_1, L1_2, L1_3 = L1_profile, L1_profile * 1.25, L1_profile * 1.5
-L2_1, L2_2, L2_3 = L2_profile, L2_profile * 1.25, L2_profile * 1.5
-
-L1_1 = np.round(L1_1, 3)
-L1_2 = np.round(L1_2, 3)
-L1_3 = np.round(L1_3, 3)
-L2_1 = np.round(L2_1, 3)
-L2_2 = np.round(L2_2, 3)
-L2_3 = np.round(L2_3, 3)
-
-# Store load profiles in a list
-load_profiles = [L1_1, L1_2, L1_3, L2_1, L2_2, L2_3]
+# Deviation factors of the load profiles
+deviations = [1, 1.25, 1.5]
 
 # PV Generation Curve G1
 scale_factor = 3333.333333333
 time_peak = 12
 width = 8
 
-G1 = scale_factor * np.exp(-((time - time_peak) ** 2) / width)
-G1 += 5 * np.random.normal(size=time.size) * ((time > 6) & (time < 18))
-G1 += 20 * np.random.normal(size=time.size) * ((time > 9) & (time < 16))
+def time_grid(time_slots=time_slots):
+    return np.linspace(0, 24, time_slots + 1)[:-1]  # Creates time_slots points over 24 hours
 
-G1 = np.round(G1, 3)
+# PV power with measurement noise around the clear-sky curve
+def pv_generation(rng=np.random, time=None):
+    if time is None:
+        time = time_grid()
+    G1 = scale_factor * np.exp(-((time - time_peak) ** 2) / width)
+    G1 += 5 * rng.normal(size=time.size) * ((time > 6) & (time < 18))
+    G1 += 20 * rng.normal(size=time.size) * ((time > 9) & (time < 16))
+    return np.round(G1, 3)
 
 # function to determine weather each day
-def weather(alpha_prev_day):
+def weather(alpha_prev_day, rng=np.random):
     #alpha = abs(1 - abs(np.random.normal(loc = alpha_prev_day)))     # better for seed(0)
-    alpha = abs(np.random.normal(loc = alpha_prev_day))     # better w/o seed
+    alpha = abs(rng.normal(loc = alpha_prev_day))     # better w/o seed
     return 1 if alpha > 1 else alpha
 
-# Plot
-fig, ax1 = plt.subplots(figsize=(10, 6))
-
-ax1.plot(time, L1_1, label='L1-1', color='red')
-ax1.plot(time, L1_2, label='L1-2', linestyle='--', color='red')
-ax1.plot(time, L1_3, label='L1-3', linestyle=':', color='red')
-ax1.plot(time, L2_1, label='L2-1', color='blue')
-ax1.plot(time, L2_2, label='L2-2', linestyle='--', color='blue')
-ax1.plot(time, L2_3, label='L2-3', linestyle=':', color='blue')
-
-ax1.set_xlabel('Time (h)')
-ax1.set_ylabel('Load powers (W)')
-ax1.set_ylim(0, 1600)
-
-# Zweite Y-Achse für G1
-ax2 = ax1.twinx()
-ax2.plot(time, G1, label='G1', color='orange')
-ax2.set_ylabel('PV power (W)')
-ax2.set_ylim(0, 4000)
-
-# Legende für beide Y-Achsen
-lines_1, labels_1 = ax1.get_legend_handles_labels()
-lines_2, labels_2 = ax2.get_legend_handles_labels()
-ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='best')
-
-plt.title('One-day load consumption and PV generation profiles')
-plt.grid()
-plt.show()
-
-
-# Umwandeln in kWh pro 15-Minuten-Intervall
-def power_to_kwh(power_profile):
-    # Jedes Intervall ist 15 Minuten lang, was 0,25 Stunden entspricht
-    return np.round(power_profile * 0.25 / 1000, 3)
-
-# Berechnung der kWh für jedes Profil
-load_profiles = [power_to_kwh(profile) for profile in load_profiles]
-G1 = power_to_kwh(G1)
+# Umwandeln in kWh pro Intervall (15 Minuten entsprechen 0,25 Stunden)
+def power_to_kwh(power_profile, hours=0.25):
+    return np.round(power_profile * hours / 1000, 3)
+
+# Load and PV profiles for one resolution and scale. Nothing is computed before it is first accessed,
+# every profile is cached afterwards. scipy is only imported when the splines are needed.
+class ProfileProvider:
+    def __init__(self, time_slots=time_slots, scale=1.0, rng=None):
+        self.time_slots = time_slots
+        self.scale = scale
+        self.rng = np.random if rng is None else rng
+
+    @cached_property
+    def time(self):
+        return time_grid(self.time_slots)
+
+    # Cubic splines through the hourly load values, evaluated at the time array (W)
+    @cached_property
+    def L1_profile(self):
+        from scipy.interpolate import CubicSpline
+        return CubicSpline(time_points, L1_values)(self.time) * self.scale
+
+    @cached_property
+    def L2_profile(self):
+        from scipy.interpolate import CubicSpline
+        return CubicSpline(time_points, L2_values)(self.time) * self.scale
+
+    # Deviation profiles L1-1 ... L2-3 in W
+    @cached_property
+    def load_power_profiles(self):
+        return [np.round(profile * deviation, 3) for profile in (self.L1_profile, self.L2_profile) for deviation in deviations]
+
+    @cached_property
+    def pv_power_profile(self):
+        return np.round(pv_generation(self.rng, self.time) * self.scale, 3)
+
+    # Profiles in kWh per time slot as used by the participants
+    @cached_property
+    def load_profiles(self):
+        return [power_to_kwh(profile, 24 / self.time_slots) for profile in self.load_power_profiles]
+
+    @cached_property
+    def G1(self):
+        return power_to_kwh(self.pv_power_profile, 24 / self.time_slots)
+
+default_providers = {}
+
+# Cached provider per (time_slots, scale), the module level profiles come from the default one
+def profile_provider(time_slots=time_slots, scale=1.0):
+    key = (time_slots, scale)
+    if key not in default_providers:
+        default_providers[key] = ProfileProvider(time_slots, scale)
+    return default_providers[key]
+
+# load_profiles, G1, time, L1_profile, ... stay importable from the module but are computed on first access
+def __getattr__(name):
+    provider = profile_provider()
+    names = {'L1_1': 0, 'L1_2': 1, 'L1_3': 2, 'L2_1': 3, 'L2_2': 4, 'L2_3': 5}
+    if name in names:
+        return provider.load_power_profiles[names[name]]
+    if name in ('time', 'L1_profile', 'L2_profile', 'load_profiles', 'G1'):
+        return getattr(provider, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Plot of the load and PV power profiles, shown on screen or written to path
+def plot_profiles(provider=None, path=None):
+    import matplotlib
+    if path is not None:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    provider = provider or profile_provider()
+    L1_1, L1_2, L1_3, L2_1, L2_2, L2_3 = provider.load_power_profiles
+    time = provider.time
+
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    ax1.plot(time, L1_1, label='L1-1', color='red')
+    ax1.plot(time, L1_2, label='L1-2', linestyle='--', color='red')
+    ax1.plot(time, L1_3, label='L1-3', linestyle=':', color='red')
+    ax1.plot(time, L2_1, label='L2-1', color='blue')
+    ax1.plot(time, L2_2, label='L2-2', linestyle='--', color='blue')
+    ax1.plot(time, L2_3, label='L2-3', linestyle=':', color='blue')
+
+    ax1.set_xlabel('Time (h)')
+    ax1.set_ylabel('Load powers (W)')
+    ax1.set_ylim(0, 1600 * provider.scale)
+
+    # Zweite Y-Achse für G1
+    ax2 = ax1.twinx()
+    ax2.plot(time, provider.pv_power_profile, label='G1', color='orange')
+    ax2.set_ylabel('PV power (W)')
+    ax2.set_ylim(0, 4000 * provider.scale)
+
+    # Legende für beide Y-Achsen
+    lines_1, labels_1 = ax1.get_legend_handles_labels()
+    lines_2, labels_2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='best')
+
+    plt.title('One-day load consumption and PV generation profiles')
+    plt.grid()
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+        plt.close(fig)
 
 # Ausgabe der kWh-Profile
-for i, profile in enumerate(load_profiles, 1):
-    print(f"L{i}-1 kWh: {profile}")
+def print_profiles(provider=None):
+    provider = provider or profile_provider()
+    for i, profile in enumerate(provider.load_profiles, 1):
+        print(f"L{i}-1 kWh: {profile}")
+    print(f"G1 kWh: {provider.G1}")
+
 
-print(f"G1 kWh: {G1}")
\ No newline at end of file
+if __name__ == '__main__':
+    plot_profiles()
+    print_profiles()
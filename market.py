@@ -1,11 +1,22 @@
+import heapq
+from collections import namedtuple
 import numpy as np
+from indexes import MarketMetrics
+from events import EventStream
+from otc import OTCEngine
 
 class Participant:
-    def __init__(self, id, load_profile, pv=False, pv_profile=None, battery_capacity=0):
+    def __init__(self, id, load_profile, pv=False, pv_profile=None, battery_capacity=0, copy=True):
         self.id = id
         self.pv = pv
-        self.energy_demand = np.round(load_profile.copy(), 3)
-        self.energy_supply = np.round(pv_profile.copy(), 3) if pv else np.zeros_like(load_profile)
+        self.load_profile = load_profile        # unmodified profiles, used to start further days
+        self.pv_profile = pv_profile
+        if copy:
+            self.energy_demand = np.round(load_profile.copy(), 3)
+            self.energy_supply = np.round(pv_profile.copy(), 3) if pv else np.zeros_like(load_profile)
+        else:       # profiles are used as given (e.g. generator.ProfileView), consumers need a zero pv_profile too
+            self.energy_demand = load_profile
+            self.energy_supply = pv_profile
         self.cost = 0
         self.revenue = 0
         self.__energy_storage = 0
@@ -25,40 +36,166 @@ class Participant:
     def get_storage(self):          # Method to get private attribute energy_storage
         return self.__energy_storage
 
+    # Restore demand and supply for a new day with the pv profile scaled by the weather,
+    # battery storage, cost and revenue carry over
+    def start_day(self, pv_scale=1):
+        if not isinstance(self.energy_demand, np.ndarray):
+            self.energy_demand.reset()
+            self.energy_supply.reset(pv_scale if self.pv else 1)
+            return
+        self.energy_demand[:] = np.round(self.load_profile, 3)
+        if self.pv:
+            self.energy_supply[:] = np.round(self.pv_profile * pv_scale, 3)
+
+BookSummary = namedtuple('BookSummary', ['best_bid', 'best_ask'])     # None for an empty side
+
+# Order book with one price-priority heap per side. Orders live in a dict keyed by an increasing
+# sequence number, so iteration follows insertion order and cancelled orders are simply dropped
+# from the dict (their heap entries are skipped once they reach the top).
+class OrderBook:
+    def __init__(self):
+        self.orders = {}        # seq -> [participant_id, side, price, quantity, time_slot]
+        self.bids = []          # heap of (-price, seq), best bid on top
+        self.asks = []          # heap of (price, seq), best ask on top
+        self.next_seq = 0
+        self.partial_fills = 0      # orders left with a residual after a match, counted over the book's lifetime
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __iter__(self):
+        return (tuple(order) for order in self.orders.values())
+
+    def add(self, participant_id, side, price, quantity, time_slot):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.orders[seq] = [participant_id, side, price, quantity, time_slot]
+        if side == 'bid':
+            heapq.heappush(self.bids, (-price, seq))
+        else:
+            heapq.heappush(self.asks, (price, seq))
+        return seq
+
+    def cancel(self, seq):
+        return self.orders.pop(seq, None)
+
+    def clear(self):
+        self.orders = {}
+        self.bids = []
+        self.asks = []
+
+    # Reduce the quantity of an order in place, fully filled orders leave the book
+    def fill(self, seq, quantity):
+        order = self.orders[seq]
+        order[3] -= quantity
+        if order[3] <= 0:
+            del self.orders[seq]
+        return order[3]
+
+    def best_bid(self):
+        seq = self._top(self.bids)
+        return None if seq is None else tuple(self.orders[seq])
+
+    def best_ask(self):
+        seq = self._top(self.asks)
+        return None if seq is None else tuple(self.orders[seq])
+
+    def _top(self, heap):
+        while heap and heap[0][1] not in self.orders:
+            heapq.heappop(heap)
+        return heap[0][1] if heap else None
+
+    # Pair the best bid with the best ask as long as prices cross and trade at the midpoint.
+    # Every order takes part in at most one match per call, partially filled orders are
+    # queued again behind the rest of the book once the pass is over.
+    def match(self):
+        matches = []
+        residuals = []
+        while True:
+            bid_seq = self._top(self.bids)
+            ask_seq = self._top(self.asks)
+            if bid_seq is None or ask_seq is None:
+                break
+            bid = self.orders[bid_seq]
+            ask = self.orders[ask_seq]
+            if bid[2] < ask[2]:
+                break
+            heapq.heappop(self.bids)
+            heapq.heappop(self.asks)
+
+            quantity = min(bid[3], ask[3])
+            match_price = (bid[2] + ask[2]) / 2
+            matches.append((ask[0], bid[0], quantity, match_price))
+            for seq in (bid_seq, ask_seq):
+                if self.fill(seq, quantity) > 0:
+                    residuals.append(seq)
+        self.partial_fills += len(residuals)
+
+        for seq in residuals:
+            self.add(*self.orders.pop(seq))
+        return matches
+
 class CDAMarket:
-    def __init__(self, participants, otc_contracts, min_price, max_price):
+    def __init__(self, participants, otc_contracts, min_price, max_price, rng=None):
         self.participants = participants
+        self.participant_index = {participant.id: participant for participant in participants}
+        self.participant_ids = [participant.id for participant in participants]       # integer number -> id, used by the trade log
+        self.participant_numbers = {participant_id: number for number, participant_id in enumerate(self.participant_ids)}
         self.otc_contracts = otc_contracts
+        self.otc_engine = None          # otc.OTCEngine, compiled on first use and again after membership changes
         self.min_price = min_price
         self.max_price = max_price
-        self.order_book = []
+        self.order_book = OrderBook()
         self.previous_order_book = []
         self.trade_history = []
+        self.keep_history = True        # False stops collecting trade prices in trade_history
+        self.trade_log = None           # optional tradelog.TradeLog receiving every match
+        self.current_round = 0
         self.provider_sell = 0
         self.provider_buy = 0
         self.traditional_buyers = 0
         self.traditional_sellers = 0
+        self.metrics = MarketMetrics()      # running index sums, fed while trading
+        self.rng = rng          # np.random.Generator handed to the strategies, None uses the global np.random
+        self.events = EventStream()     # add sinks to receive order, match, otc, battery and provider events
+        self.incremental = False        # True keeps orders between rounds, see collect_changed_orders
+        self.active = []                # participants with residual demand or supply in active_slot
+        self.active_slot = None
+        self.active_trades = None       # trade count when active was last filtered
+        self.active_sides = (False, False)      # whether active has buyers and sellers
 
-    # Apply OTC contracts to adjust energy demand and supply before the order matching starts
-    def apply_otc_contracts(self, time_slot):
-        for contract in self.otc_contracts:
-            buyer_id, seller_id, quantity, price = contract
-            for participant in self.participants:
-                if participant.id == seller_id:
-                    seller = participant
-                if participant.id == buyer_id:
-                    buyer = participant
-    
-            # Check if the seller has enough supply and buyer has enough demand
-            if seller.energy_supply[time_slot] >= quantity and buyer.energy_demand[time_slot] >= quantity:
-                # Adjust supply and demand
-                seller.energy_supply[time_slot] -= quantity
-                buyer.energy_demand[time_slot] -= quantity
+    def get_participant(self, participant_id):
+        return self.participant_index[participant_id]
+
+    # Participants can join or leave during the day, the id index is kept in sync with the list
+    def add_participant(self, participant):
+        if participant.id in self.participant_index:
+            raise ValueError(f"Participant {participant.id} is already part of the market")
+        self.participants.append(participant)
+        self.participant_index[participant.id] = participant
+        if participant.id not in self.participant_numbers:       # numbers stay stable when a participant rejoins
+            self.participant_numbers[participant.id] = len(self.participant_ids)
+            self.participant_ids.append(participant.id)
+        self.otc_engine = None
+        self.active_slot = None
 
-                # Adjust financial transactions
-                seller.revenue += quantity * price
-                buyer.cost += quantity * price
-                print(f"OTC Contract executed: {seller_id} sells {quantity} kWh to {buyer_id} at {price}€ per unit.")
+    def remove_participant(self, participant_id):
+        participant = self.participant_index.pop(participant_id)
+        self.participants.remove(participant)
+        for seq, order in list(self.order_book.orders.items()):        # withdraw open orders
+            if order[0] == participant_id:
+                self.order_book.cancel(seq)
+        self.otc_engine = None
+        self.active_slot = None
+        return participant
+
+    # Apply OTC contracts to adjust energy demand and supply before the order matching starts.
+    # The contracts are compiled once (see otc.OTCEngine), a slot only visits the ones that can execute.
+    def apply_otc_contracts(self, time_slot):
+        if self.otc_engine is None:
+            time_slots = len(self.participants[0].energy_demand) if self.participants else 0
+            self.otc_engine = OTCEngine(self.otc_contracts, self.participant_index, time_slots)
+        return self.otc_engine.execute(self, time_slot)
 
     # Prosumers consume their energy first
     def balance_prosumer_energy(self, time_slot):
@@ -75,7 +212,10 @@ class CDAMarket:
                     participant.energy_demand[time_slot] = -net_energy
                     participant.energy_supply[time_slot] = 0
    
-    def manage_battery_storage(self, time_slot, bat_strategy, printer):
+    def manage_battery_storage(self, time_slot, bat_strategy):
+            if not isinstance(bat_strategy, str):
+                raise ValueError("Battery dispatch policies need a VectorizedCDAMarket")
+            events = self.events
             for participant in self.participants:
                 if participant.pv:
                     net_energy = participant.energy_supply[time_slot] - participant.energy_demand[time_slot]
@@ -83,109 +223,209 @@ class CDAMarket:
                     if bat_strategy == 'bat_CDA' and net_energy > 0:
                         excess_energy = participant.load_battery(net_energy)
                         participant.energy_supply[time_slot] = excess_energy
-                        if printer: print(f"Participant {participant.id} - Excess energy after loading battery: {excess_energy} kWh")
+                        if 'battery_load' in events.wanted:
+                            events.emit('battery_load', participant.id, excess_energy, time_slot)
                     elif net_energy < 0:
                         needed_energy = - net_energy
                         withdrawn_energy = participant.withdraw_battery(needed_energy)
                         participant.energy_demand[time_slot] -= withdrawn_energy
-                        if printer: print(f"Participant {participant.id} - Additional energy needed after battery withdrawal: {needed_energy} kWh")
+                        if 'battery_withdraw' in events.wanted:
+                            events.emit('battery_withdraw', participant.id, needed_energy, withdrawn_energy, time_slot)
+
+    # Collect orders from participants based on their strategy. Batched strategies price the
+    # whole population in one call, plain per-participant strategies are called once each.
+    def collect_orders(self, strategy, time_slot, current_round, total_rounds):
+        self.current_round = current_round
+        if self.incremental:
+            self.collect_changed_orders(strategy, time_slot, current_round, total_rounds)
+            return
+        if getattr(strategy, 'batched', False):
+            self.collect_batched_orders(strategy, time_slot, current_round, total_rounds)
+            return
 
-    # Collect orders from participants based on their strategy
-    def collect_orders(self, strategy, time_slot, current_round, total_rounds, printer):
-        self.previous_order_book = self.order_book.copy()
-        self.order_book = []
+        options = {} if self.rng is None else {'rng': self.rng}
+        self.previous_order_book = list(self.order_book)
+        self.order_book.clear()
+        current_bids = [order for order in self.previous_order_book if order[1] == 'bid']
+        current_asks = [order for order in self.previous_order_book if order[1] == 'ask']
         for participant in self.participants:
-            current_bids = [order for order in self.previous_order_book if order[1] == 'bid']
-            current_asks = [order for order in self.previous_order_book if order[1] == 'ask']
             bid_price, bid_quantity, ask_price, ask_quantity = strategy(
-                participant, self.min_price, self.max_price, time_slot, current_bids, current_asks, current_round, total_rounds)
-            if bid_quantity > 0:
-                self.order_book.append((participant.id, 'bid', bid_price, bid_quantity, time_slot))
-                if printer: print(f"{participant.id} places bid for {bid_quantity} kWh at {bid_price}€/kWh")
-            if ask_quantity > 0:
-                self.order_book.append((participant.id, 'ask', ask_price, ask_quantity, time_slot))
-                if printer: print(f"{participant.id} places ask for {ask_quantity} kWh at {ask_price}€/kWh")
+                participant, self.min_price, self.max_price, time_slot, current_bids, current_asks, current_round, total_rounds, **options)
+            self.place_orders(participant.id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot)
 
+    def collect_batched_orders(self, strategy, time_slot, current_round, total_rounds):
+        book = self.book_summary()
+        self.order_book.clear()
+        demand, supply, pv = self.slot_arrays(time_slot)
+        options = {} if self.rng is None else {'rng': self.rng}
+        bid_prices, bid_quantities, ask_prices, ask_quantities = strategy(
+            demand, supply, pv, self.min_price, self.max_price, book, current_round, total_rounds, **options)
+        for i in np.flatnonzero((bid_quantities > 0) | (ask_quantities > 0)):
+            self.place_orders(self.participants[i].id, bid_prices[i], bid_quantities[i], ask_prices[i], ask_quantities[i], time_slot)
 
-    # Match orders based on the current order book
-    def match_orders(self, time_slot, printer):
-        # Bids are sorted in descending order
-        bids = sorted([order for order in self.order_book if order[1] == 'bid'], key=lambda x: -x[2])
-        # Asks are sorted in ascending order
-        asks = sorted([order for order in self.order_book if order[1] == 'ask'], key=lambda x: x[2])
+    # Incremental mode: the book is kept between the rounds of a slot and only participants with
+    # residual demand or supply are asked again. Per-participant strategies get the best bid and ask as
+    # one-element lists instead of the whole previous book (batched strategies get the BookSummary as
+    # before), and an order is only replaced when its price or quantity changed, so unchanged orders keep
+    # their place in the book. Once only buyers or only sellers are left nothing can match anymore and
+    # clear_market settles the open orders at provider prices whatever their price, so the remaining rounds
+    # of the slot are skipped. A round costs time in proportion to the participants still trading.
+    def collect_changed_orders(self, strategy, time_slot, current_round, total_rounds):
+        options = {} if self.rng is None else {'rng': self.rng}
+        open_orders = {(order[0], order[1]): seq for seq, order in self.order_book.orders.items()}
+        if getattr(strategy, 'batched', False):
+            book = self.book_summary()
+            demand, supply, pv = self.slot_arrays(time_slot)
+            buying, selling = demand > 0, pv & (supply > 0)
+            if current_round > 0 and not (buying.any() and selling.any()):
+                return
+            active = np.flatnonzero(buying | selling)
+            bid_prices, bid_quantities, ask_prices, ask_quantities = strategy(
+                demand[active], supply[active], pv[active], self.min_price, self.max_price, book, current_round, total_rounds, **options)
+            for i, index in enumerate(active.tolist()):
+                self.update_orders(open_orders, self.participants[index].id, bid_prices[i], bid_quantities[i], ask_prices[i], ask_quantities[i], time_slot)
+            return
 
-        matches = []
-        iterations = min(len(bids), len(asks))
-        for i in range(iterations):
-            bid = bids[i]
-            ask = asks[i]
-            if bid[2] >= ask[2]:
-                quantity = min(bid[3], ask[3])
-                match_price = (bid[2] + ask[2]) / 2
-                matches.append((ask[0], bid[0], quantity, match_price))
-                self.trade_history.append(match_price) # Add trade to trade history
-                
-                # Find participant and update demand/supply for current time slot
-                for participant in self.participants:
-                    if participant.id == bid[0]:
-                        participant.energy_demand[time_slot] -= quantity
-                        participant.cost += quantity * match_price
-                    if participant.id == ask[0]:
-                        participant.energy_supply[time_slot] -= quantity
-                        participant.revenue += quantity * match_price
-                
-                # Update order book
-                self.order_book.remove(bid)
-                self.order_book.remove(ask)
-                updated_bid_quantity = bid[3] - quantity
-                updated_ask_quantity = ask[3] - quantity
-                if updated_bid_quantity > 0:
-                    self.order_book.append((bid[0], 'bid', bid[2], updated_bid_quantity, bid[4]))
-                if updated_ask_quantity > 0:
-                    self.order_book.append((ask[0], 'ask', ask[2], updated_ask_quantity, ask[4]))
-        if printer:
-            if len(matches) > 0:
-                for match in matches:
-                    print(f"Matched order: {match[0]} sells {match[2]} kWh to {match[1]} at {match[3]}€/ with total cost {match[2] * match[3]}€")
+        if current_round == 0 or self.active_slot != time_slot:
+            self.active = self.participants
+            self.active_slot = time_slot
+            self.active_trades = None
+        if self.metrics.total.count != self.active_trades:        # residuals only change through trades
+            self.active = [participant for participant in self.active
+                           if participant.energy_demand[time_slot] > 0 or (participant.pv and participant.energy_supply[time_slot] > 0)]
+            self.active_trades = self.metrics.total.count
+            self.active_sides = (any(participant.energy_demand[time_slot] > 0 for participant in self.active),
+                                 any(participant.pv and participant.energy_supply[time_slot] > 0 for participant in self.active))
+        if current_round > 0 and not all(self.active_sides):
+            return
+        best_bid = self.order_book.best_bid()
+        best_ask = self.order_book.best_ask()
+        current_bids = [best_bid] if best_bid else []
+        current_asks = [best_ask] if best_ask else []
+        for participant in self.active:
+            bid_price, bid_quantity, ask_price, ask_quantity = strategy(
+                participant, self.min_price, self.max_price, time_slot, current_bids, current_asks, current_round, total_rounds, **options)
+            self.update_orders(open_orders, participant.id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot)
+
+    # Keep a participant's open order on each side when price and quantity are unchanged, replace it otherwise
+    def update_orders(self, open_orders, participant_id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot):
+        orders = self.order_book.orders
+        bid_seq = open_orders.get((participant_id, 'bid'))
+        if bid_seq is not None:
+            order = orders[bid_seq]
+            if order[2] == bid_price and order[3] == bid_quantity:
+                bid_quantity = 0
+            else:
+                del orders[bid_seq]
+        ask_seq = open_orders.get((participant_id, 'ask'))
+        if ask_seq is not None:
+            order = orders[ask_seq]
+            if order[2] == ask_price and order[3] == ask_quantity:
+                ask_quantity = 0
             else:
-                print("No matches found for this round.")
+                del orders[ask_seq]
+        self.place_orders(participant_id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot)
+
+    def place_orders(self, participant_id, bid_price, bid_quantity, ask_price, ask_quantity, time_slot):
+        if bid_quantity > 0:
+            self.order_book.add(participant_id, 'bid', bid_price, bid_quantity, time_slot)
+            if 'order' in self.events.wanted:
+                self.events.emit('order', participant_id, 'bid', bid_price, bid_quantity, time_slot)
+        if ask_quantity > 0:
+            self.order_book.add(participant_id, 'ask', ask_price, ask_quantity, time_slot)
+            if 'order' in self.events.wanted:
+                self.events.emit('order', participant_id, 'ask', ask_price, ask_quantity, time_slot)
+
+    # Best bid and ask price of the current order book, shared by all participants in a round
+    def book_summary(self):
+        best_bid = self.order_book.best_bid()
+        best_ask = self.order_book.best_ask()
+        return BookSummary(best_bid[2] if best_bid else None, best_ask[2] if best_ask else None)
+
+    # Demand, supply and pv flag of all participants for one time slot
+    def slot_arrays(self, time_slot):
+        count = len(self.participants)
+        demand = np.fromiter((participant.energy_demand[time_slot] for participant in self.participants), float, count)
+        supply = np.fromiter((participant.energy_supply[time_slot] for participant in self.participants), float, count)
+        pv = np.fromiter((participant.pv for participant in self.participants), bool, count)
+        return demand, supply, pv
+
+    # Match orders based on the current order book
+    def match_orders(self, time_slot):
+        matches = self.order_book.match()
+        log_matches = 'match' in self.events.wanted
+        for seller_id, buyer_id, quantity, match_price in matches:
+            self.execute_trade(seller_id, buyer_id, quantity, match_price, time_slot, log_matches)
         return matches
     
 
+    # Book one match: history, trade log, metrics and demand/supply and cost/revenue of both sides
+    def execute_trade(self, seller_id, buyer_id, quantity, match_price, time_slot, log_match=False):
+        if self.keep_history:
+            self.trade_history.append(match_price) # Add trade to trade history
+        if self.trade_log is not None:
+            self.trade_log.append(self.participant_numbers[seller_id], self.participant_numbers[buyer_id], quantity, match_price, time_slot, self.current_round)
+        self.metrics.add_trade(time_slot, quantity, match_price)
+
+        # Update demand/supply of buyer and seller for current time slot
+        buyer = self.participant_index[buyer_id]
+        buyer.energy_demand[time_slot] -= quantity
+        buyer.cost += quantity * match_price
+        seller = self.participant_index[seller_id]
+        seller.energy_supply[time_slot] -= quantity
+        seller.revenue += quantity * match_price
+        if log_match:
+            self.events.emit('match', seller_id, buyer_id, quantity, match_price, time_slot, self.current_round)
+
     # Clear unmatched orders with provider prices
-    def clear_market(self, bat_strategy, printer):
-        for order in self.order_book:
-            participant = next(p for p in self.participants if p.id == order[0])
+    def clear_market(self, bat_strategy):
+        log_provider = 'provider' in self.events.wanted
+        orders = list(self.order_book)
+        asks = [order for order in orders if order[1] == 'ask']
+        for order in orders:
             if order[1] == 'bid':
+                participant = self.participant_index[order[0]]
                 cost =  order[3] * self.max_price
                 participant.cost += cost
                 self.provider_buy += cost
-                if printer: print(f"Unmatched bid for {participant.id} cleared with provider: {order[3]} kWh for {order[0]} at {self.max_price}€/kWh with total cost {cost}€")
-            else:
-                remaining_quantity = order[3]
-                if bat_strategy == 'CDA_bat':
-                    remaining_quantity = participant.load_battery(order[3])
-                #remaining_quantity = participant.load_battery(order[3])
-                if remaining_quantity > 0:
-                    revenue = remaining_quantity * self.min_price
-                    participant.revenue += revenue
-                    self.provider_sell += revenue
-                    if printer: print(f"Unmatched ask for {participant.id} cleared with provider: {remaining_quantity} kWh from {order[0]} at {self.min_price}€/kWh with total revenue {revenue}€")
-        self.order_book = []
+                self.metrics.add_provider(order[4], cost, 0)
+                if log_provider:
+                    self.events.emit('provider', participant.id, 'bid', order[3], self.max_price, cost, order[4])
+
+        for order, remaining_quantity in zip(asks, self.store_unmatched(asks, bat_strategy)):
+            if remaining_quantity > 0:
+                participant = self.participant_index[order[0]]
+                revenue = remaining_quantity * self.min_price
+                participant.revenue += revenue
+                self.provider_sell += revenue
+                self.metrics.add_provider(order[4], 0, revenue)
+                if log_provider:
+                    self.events.emit('provider', participant.id, 'ask', remaining_quantity, self.min_price, revenue, order[4])
+        self.order_book.clear()
+
+    # Quantities of the unmatched asks left for the provider, 'CDA_bat' first loads them into the batteries
+    def store_unmatched(self, asks, bat_strategy):
+        if bat_strategy == 'CDA_bat':
+            return [self.participant_index[order[0]].load_battery(order[3]) for order in asks]
+        return [order[3] for order in asks]
     
     def traditional_prices(self, time_slot):
+        buyers = sellers = 0
         for participant in self.participants:
             net_energy = participant.energy_supply[time_slot] - participant.energy_demand[time_slot]
 
             if net_energy > 0:
                 self.traditional_sellers += net_energy * self.min_price
+                sellers += net_energy * self.min_price
             else:
                 self.traditional_buyers += abs(net_energy) * self.max_price
+                buyers += abs(net_energy) * self.max_price
+        self.metrics.add_traditional(time_slot, buyers, sellers)
 
 
 
 # Zero-Intelligence Strategy where agents randomly choose a price and quantity
-def zi_strategy(participant, min_price, max_price, time_slot, current_bids, current_asks, current_round, total_rounds):
+def zi_strategy(participant, min_price, max_price, time_slot, current_bids, current_asks, current_round, total_rounds, rng=np.random):
     bid_price = ask_price = bid_quantity = ask_quantity = 0
 
     # Prosumers can only sell energy if they have excess energy
@@ -196,18 +436,18 @@ def zi_strategy(participant, min_price, max_price, time_slot, current_bids, curr
     #        ask_quantity = total_supply
 
     if participant.pv and participant.energy_supply[time_slot] > 0:
-        ask_price = np.random.uniform(min_price, max_price)
+        ask_price = rng.uniform(min_price, max_price)
         ask_quantity = participant.energy_supply[time_slot]
     
     # All participants can buy energy
     if participant.energy_demand[time_slot] > 0:
-        bid_price = np.random.uniform(min_price, max_price)
+        bid_price = rng.uniform(min_price, max_price)
         bid_quantity = participant.energy_demand[time_slot]
     
     return bid_price, bid_quantity, ask_price, ask_quantity
 
 # EOB Strategy where agents choose a price based on the current market state
-def eob_strategy(participant, min_price, max_price, time_slot, current_bids, current_asks, current_round, total_rounds):
+def eob_strategy(participant, min_price, max_price, time_slot, current_bids, current_asks, current_round, total_rounds, rng=np.random):
     bid_price = ask_price = bid_quantity = ask_quantity = 0
     
     remaining_time_factor = (total_rounds - current_round) / total_rounds
@@ -223,8 +463,8 @@ def eob_strategy(participant, min_price, max_price, time_slot, current_bids, cur
             bid_price = min(max_price, max_bid + delta)
             ask_price = max(min_price, min_ask - delta)
     else:
-        bid_price = np.random.uniform(min_price, max_price - delta)
-        ask_price = np.random.uniform(min_price + delta, max_price)
+        bid_price = rng.uniform(min_price, max_price - delta)
+        ask_price = rng.uniform(min_price + delta, max_price)
 
     if participant.energy_demand[time_slot] > 0:
         bid_quantity = participant.energy_demand[time_slot]
@@ -243,4 +483,44 @@ def eob_strategy(participant, min_price, max_price, time_slot, current_bids, cur
     else:
         ask_price = 0
 
-    return bid_price, bid_quantity, ask_price, ask_quantity
\ No newline at end of file
+    return bid_price, bid_quantity, ask_price, ask_quantity
+
+
+# Mark a strategy as batched: it is called once per round with arrays of demand, supply and pv
+# flags plus a BookSummary, and returns bid prices, bid quantities, ask prices and ask quantities
+def batched(strategy):
+    strategy.batched = True
+    return strategy
+
+# Zero-Intelligence Strategy for the whole population at once
+@batched
+def zi_batch_strategy(demand, supply, pv, min_price, max_price, book, current_round, total_rounds, rng=np.random):
+    selling = pv & (supply > 0)
+    buying = demand > 0
+    bid_prices = np.zeros(len(demand))
+    ask_prices = np.zeros(len(demand))
+    ask_prices[selling] = rng.uniform(min_price, max_price, np.count_nonzero(selling))
+    bid_prices[buying] = rng.uniform(min_price, max_price, np.count_nonzero(buying))
+    return bid_prices, np.where(buying, demand, 0), ask_prices, np.where(selling, supply, 0)
+
+# EOB Strategy for the whole population at once, the book summary replaces the bid/ask lists
+@batched
+def eob_batch_strategy(demand, supply, pv, min_price, max_price, book, current_round, total_rounds, rng=np.random):
+    remaining_time_factor = (total_rounds - current_round) / total_rounds
+    delta = remaining_time_factor * (max_price - min_price) / 100
+    if book.best_bid is not None and book.best_ask is not None:
+        if book.best_bid >= book.best_ask:
+            bid_price = max(min_price, book.best_bid - delta)
+            ask_price = min(max_price, book.best_ask + delta)
+        else:
+            bid_price = min(max_price, book.best_bid + delta)
+            ask_price = max(min_price, book.best_ask - delta)
+        bid_prices = np.full(len(demand), bid_price)
+        ask_prices = np.full(len(demand), ask_price)
+    else:
+        bid_prices = rng.uniform(min_price, max_price - delta, len(demand))
+        ask_prices = rng.uniform(min_price + delta, max_price, len(demand))
+
+    buying = demand > 0
+    selling = pv & (supply > 0)
+    return np.where(buying, bid_prices, 0), np.where(buying, demand, 0), np.where(selling, ask_prices, 0), np.where(selling, supply, 0)
@@ -0,0 +1,92 @@
+import numpy as np
+
+# A mechanism decides how often orders are collected per time slot and how the order book is matched.
+# Orders come from the usual strategies, OTC contracts, batteries and the provider clearing of
+# unmatched orders stay in CDAMarket, so every mechanism feeds the same metrics.
+
+# Continuous double auction: rounds of order collection, each matched by CDAMarket.match_orders
+# (best bid with best ask at the midpoint price)
+class ContinuousDoubleAuction:
+    name = 'cda'
+
+    def rounds(self, rounds):
+        return rounds
+
+    def match(self, market, time_slot):
+        return market.match_orders(time_slot)
+
+# Uniform-price call auction: all orders of a call are cleared at one price where aggregated demand
+# meets aggregated supply. Bids are sorted by descending, asks by ascending price, the traded volume is
+# the largest quantity that buyers accept at a price sellers accept, and the price is the midpoint of the
+# last accepted bid and ask. Accepted bids and asks are paired along their cumulative quantities, every
+# piece where one bid overlaps one ask is a trade. Unfilled rest stays in the book for clear_market.
+# rounds calls are run per time slot, one by default.
+class CallAuction:
+    name = 'call'
+    tolerance = 1e-12       # quantities below this count as fully filled
+
+    def __init__(self, rounds=1):
+        self.calls = rounds
+
+    def rounds(self, rounds):
+        return self.calls
+
+    def match(self, market, time_slot):
+        book = market.order_book
+        seqs = np.fromiter(book.orders.keys(), np.int64, len(book))
+        orders = list(book.orders.values())
+        is_bid = np.fromiter((order[1] == 'bid' for order in orders), bool, len(orders))
+        prices = np.fromiter((order[2] for order in orders), float, len(orders))
+        quantities = np.fromiter((order[3] for order in orders), float, len(orders))
+
+        bids = np.flatnonzero(is_bid)
+        asks = np.flatnonzero(~is_bid)
+        bids = bids[np.argsort(-prices[bids], kind='stable')]
+        asks = asks[np.argsort(prices[asks], kind='stable')]
+        if len(bids) == 0 or len(asks) == 0:
+            return []
+        bid_prices, ask_prices = prices[bids], prices[asks]
+        demand = np.cumsum(quantities[bids])
+        supply = np.cumsum(quantities[asks])
+
+        # Supply offered at or below each bid price, the volume is the best of min(demand, supply) over the bids
+        offered = np.searchsorted(ask_prices, bid_prices, side='right')
+        supply_at_bid = np.where(offered > 0, supply[np.maximum(offered - 1, 0)], 0)
+        volume = np.max(np.minimum(demand, supply_at_bid))
+        if volume <= self.tolerance:
+            return []
+
+        # Orders whose cumulative quantity before them is below the volume take part
+        accepted_bids = int(np.searchsorted(demand[:-1], volume, side='left')) + 1
+        accepted_asks = int(np.searchsorted(supply[:-1], volume, side='left')) + 1
+        price = float(bid_prices[accepted_bids - 1] + ask_prices[accepted_asks - 1]) / 2
+
+        # Pieces between consecutive cumulative quantities of the accepted orders
+        bounds = np.unique(np.concatenate(([0.0], np.minimum(demand[:accepted_bids], volume), np.minimum(supply[:accepted_asks], volume))))
+        starts, pieces = bounds[:-1], np.diff(bounds)
+        keep = pieces > self.tolerance
+        starts, pieces = starts[keep], pieces[keep]
+        bid_pieces = np.minimum(np.searchsorted(demand, starts, side='right'), accepted_bids - 1)
+        ask_pieces = np.minimum(np.searchsorted(supply, starts, side='right'), accepted_asks - 1)
+
+        matches = []
+        log_matches = 'match' in market.events.wanted
+        for bid, ask, quantity in zip(bids[bid_pieces].tolist(), asks[ask_pieces].tolist(), pieces.tolist()):
+            seller_id, buyer_id = orders[ask][0], orders[bid][0]
+            matches.append((seller_id, buyer_id, quantity, price))
+            market.execute_trade(seller_id, buyer_id, quantity, price, time_slot, log_matches)
+
+        # Take the filled quantities out of the book
+        filled = np.zeros(len(orders))
+        np.add.at(filled, bids[bid_pieces], pieces)
+        np.add.at(filled, asks[ask_pieces], pieces)
+        for index in np.flatnonzero(filled > 0).tolist():
+            remaining = quantities[index] - filled[index]
+            if remaining > self.tolerance:
+                orders[index][3] = remaining
+                book.partial_fills += 1
+            else:
+                book.cancel(int(seqs[index]))
+        return matches
+
+mechanisms = {'cda': ContinuousDoubleAuction, 'call': CallAuction}
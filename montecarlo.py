@@ -0,0 +1,83 @@
+import argparse
+import math
+import numpy as np
+import simulation
+from indexes import index_names, t_quantile
+from loadProfiles import pv_generation, power_to_kwh
+from market import zi_strategy, eob_strategy
+
+# Running mean and variance of a stream of values (Welford's algorithm)
+class Welford:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.inf
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    # Width of the confidence interval around the mean (Student t)
+    def interval_width(self, confidence):
+        if self.count < 2:
+            return math.inf
+        return 2 * t_quantile(self.count, confidence) * math.sqrt(self.variance() / self.count)
+
+# Replicate one configuration with an independent np.random.Generator per run (strategies and PV noise)
+# until the confidence interval of every index is narrower than its tolerance. tolerance is a float
+# for all indexes or a dict per index name. Only the index values of each run are kept.
+def replicate(strategy, battery, tolerance, confidence=0.95, min_replications=5, max_replications=200, seed=0,
+              num_consumers=simulation.num_consumers, num_prosumers=simulation.num_prosumers, battery_capacity=5, **options):
+    tolerances = tolerance if isinstance(tolerance, dict) else {name: tolerance for name in index_names}
+    accumulators = {name: Welford() for name in index_names}
+    seed_sequence = np.random.SeedSequence(seed)
+
+    for replication in range(max_replications):
+        rng = np.random.default_rng(seed_sequence.spawn(1)[0])
+        participants = simulation.initialize_participants(
+            num_consumers, num_prosumers, battery_capacity, pv_profile=power_to_kwh(pv_generation(rng)))
+        market, _ = simulation.run_market(strategy, battery, participants=participants, rng=rng, keep_trades=False, **options)
+        indexes = simulation.market_indexes(market, decimals=None)
+        del market, participants
+        for name in index_names:
+            accumulators[name].update(indexes[name])
+
+        if replication + 1 >= min_replications and all(
+                accumulators[name].interval_width(confidence) < tolerances[name] for name in tolerances):
+            break
+
+    return {name: {
+        "mean": accumulator.mean,
+        "std": accumulator.std(),
+        "interval_width": accumulator.interval_width(confidence),
+        "replications": accumulator.count
+    } for name, accumulator in accumulators.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replicate one configuration until the index confidence intervals are narrow enough")
+    parser.add_argument('--strategy', choices=['zi_strategy', 'eob_strategy'], default='zi_strategy')
+    parser.add_argument('--battery', choices=['CDA_bat', 'bat_CDA', 'no_bat'], default='no_bat')
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--min-replications', type=int, default=5)
+    parser.add_argument('--max-replications', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    strategy = {'zi_strategy': zi_strategy, 'eob_strategy': eob_strategy}[args.strategy]
+    summary = replicate(strategy, args.battery, args.tolerance, args.confidence, args.min_replications, args.max_replications, args.seed)
+    for name, values in summary.items():
+        print(f"{name}: {values['mean']:.4f} ± {values['interval_width'] / 2:.4f} (std {values['std']:.4f}, {values['replications']} replications)")
+    return summary
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import simulation
+from battery import battery_config
+from checkpoint import load_checkpoint, save_checkpoint
+from community import CommunityState, VectorizedCDAMarket
+from loadProfiles import weather, pv_generation, power_to_kwh
+from market import CDAMarket, zi_strategy, eob_strategy
+
+# Simulate consecutive days with the same participants. Every day the pv profile is scaled by the weather
+# process, battery storage and cumulative cost/revenue carry over and a new market clears the day.
+# Yields the indexes of each day as soon as it is finished, nothing of earlier days is kept in memory.
+# With a checkpoint path the state is saved after each yielded day and an existing checkpoint is
+# continued with the day after it, so only unfinished days are simulated again.
+# Default participants take their pv noise from rng, so a seeded season can be reproduced.
+def iterate_days(strategy, battery, days, participants=None, market_class=CDAMarket, rng=None, alpha=1, trade_log=None, checkpoint=None, **options):
+    if participants is None:
+        participants = simulation.initialize_participants(pv_profile=None if rng is None else power_to_kwh(pv_generation(rng)))
+    if issubclass(market_class, VectorizedCDAMarket) and not isinstance(participants, CommunityState):
+        participants = CommunityState.from_participants(participants)
+    weather_rng = np.random if rng is None else rng
+
+    config = {"strategy": strategy.__name__, "battery": battery_config(battery), "market": market_class.__name__}
+    first_day = 0
+    snapshot = load_checkpoint(checkpoint) if checkpoint is not None else None
+    if snapshot is not None:
+        snapshot.check(config, participants)
+        snapshot.restore_participants(participants)
+        snapshot.restore_rng(rng)
+        if trade_log is not None:
+            snapshot.restore_trade_log(trade_log)
+        alpha = snapshot.values["alpha"]
+        first_day = snapshot.position["day"] + 1
+
+    for day in range(first_day, days):
+        alpha = weather(alpha, weather_rng)
+        if isinstance(participants, CommunityState):
+            participants.start_day(alpha)
+            cost, revenue, storage = participants.cost, participants.revenue, participants.storage
+        else:
+            for participant in participants:
+                participant.start_day(alpha)
+        if trade_log is not None:
+            trade_log.day = day
+
+        market, _ = simulation.run_market(strategy, battery, participants=participants, market_class=market_class, rng=rng,
+                                          keep_trades=False, trade_log=trade_log, **options)
+
+        if not isinstance(participants, CommunityState):
+            cost = [participant.cost for participant in participants]
+            revenue = [participant.revenue for participant in participants]
+            storage = [participant.get_storage() for participant in participants]
+        yield {
+            "day": day,
+            "alpha": float(alpha),
+            **{name: float(value) for name, value in simulation.market_indexes(market).items()},
+            "provider_buy": float(market.provider_buy),
+            "provider_sell": float(market.provider_sell),
+            "cumulative_cost": float(np.sum(cost)),
+            "cumulative_revenue": float(np.sum(revenue)),
+            "battery_storage": float(np.sum(storage))
+        }
+        if checkpoint is not None:
+            save_checkpoint(checkpoint, participants, {"day": day}, rng, config, trade_log=trade_log, alpha=alpha)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a season day by day and stream the daily indexes as JSON lines")
+    parser.add_argument('--strategy', choices=['zi_strategy', 'eob_strategy'], default='zi_strategy')
+    parser.add_argument('--battery', choices=['CDA_bat', 'bat_CDA', 'no_bat'], default='bat_CDA')
+    parser.add_argument('--days', type=int, default=simulation.days)
+    parser.add_argument('--engine', choices=['cda', 'vectorized'], default='cda')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help="JSON lines file, stdout if omitted")
+    parser.add_argument('--checkpoint', help="checkpoint file, an existing one is resumed and the output appended to")
+    args = parser.parse_args(argv)
+
+    strategy = {'zi_strategy': zi_strategy, 'eob_strategy': eob_strategy}[args.strategy]
+    market_class = {'cda': CDAMarket, 'vectorized': VectorizedCDAMarket}[args.engine]
+    rng = None if args.seed is None else np.random.default_rng(args.seed)
+    resume = args.checkpoint is not None and os.path.exists(args.checkpoint)
+    output = open(args.output, 'a' if resume else 'w') if args.output else sys.stdout
+    try:
+        for result in iterate_days(strategy, args.battery, args.days, market_class=market_class, rng=rng, checkpoint=args.checkpoint):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
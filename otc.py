@@ -0,0 +1,88 @@
+from collections import namedtuple
+import numpy as np
+
+# Bilateral contract. The plain (buyer, seller, quantity, price) tuples of simulation.otc_contracts are
+# contracts without extensions. quantity is a number or a schedule with one quantity per time slot, the
+# contract only applies to the slots start <= time_slot < end, and with partial=True it delivers what the
+# parties can supply and use when that is less than the contracted quantity.
+Contract = namedtuple('Contract', ['buyer', 'seller', 'quantity', 'price', 'start', 'end', 'partial'], defaults=[0, None, False])
+
+# Contracts compiled for the participants of one market. The parties are resolved once, and a vectorized
+# pass over the demand and supply of all slots keeps, per slot, only the contracts that can be executable
+# there. The pass uses demand and supply after the prosumers' own consumption (balance_prosumer_energy);
+# batteries and earlier contracts only lower them, so it never drops a contract that would execute.
+# Contracts with a party outside the market are left out, like apply_otc_contracts always did.
+class OTCEngine:
+    def __init__(self, contracts, participant_index, time_slots):
+        contracts = [Contract(*contract) for contract in contracts]
+        contracts = [contract for contract in contracts if contract.buyer in participant_index and contract.seller in participant_index]
+        self.contracts = contracts
+        self.buyers = [participant_index[contract.buyer] for contract in contracts]
+        self.sellers = [participant_index[contract.seller] for contract in contracts]
+        self.prices = [contract.price for contract in contracts]
+        self.partial = [contract.partial for contract in contracts]
+
+        slots = np.arange(time_slots)
+        starts = np.array([contract.start for contract in contracts], dtype=int)
+        ends = np.array([time_slots if contract.end is None else contract.end for contract in contracts], dtype=int)
+        window = (slots >= starts[:, None]) & (slots < ends[:, None])
+        scheduled = [i for i, contract in enumerate(contracts) if np.ndim(contract.quantity) > 0]
+        quantities = np.array([0.0 if np.ndim(contract.quantity) > 0 else contract.quantity for contract in contracts], dtype=float)
+        self.quantities = np.repeat(quantities[:, None], time_slots, axis=1)
+        for i in scheduled:
+            self.quantities[i] = contracts[i].quantity
+        self.quantities[~window] = 0
+
+        executable = self.screen(time_slots)
+        contract_numbers, slot_numbers = np.nonzero(executable.T)[::-1]        # ordered by slot, then contract
+        self.executable = contract_numbers
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(slot_numbers, minlength=time_slots))))
+
+    def __len__(self):
+        return len(self.contracts)
+
+    # Contracts x slots mask of contracts whose parties have enough supply and demand before trading
+    def screen(self, time_slots):
+        if not self.contracts:
+            return np.zeros((0, time_slots), dtype=bool)
+        parties = {participant.id: participant for participant in self.sellers + self.buyers}
+        rows = {participant_id: row for row, participant_id in enumerate(parties)}
+        supply = np.array([np.asarray(participant.energy_supply, dtype=float) for participant in parties.values()])
+        demand = np.array([np.asarray(participant.energy_demand, dtype=float) for participant in parties.values()])
+        pv = np.array([participant.pv for participant in parties.values()])
+        net = supply[pv] - demand[pv]
+        supply[pv] = np.maximum(net, 0)
+        demand[pv] = np.maximum(-net, 0)
+
+        available = np.minimum(supply[[rows[seller.id] for seller in self.sellers]], demand[[rows[buyer.id] for buyer in self.buyers]])
+        partial = np.array(self.partial)[:, None]
+        return (self.quantities > 0) & np.where(partial, available > 0, available >= self.quantities)
+
+    def slot_contracts(self, time_slot):
+        return self.executable[self.offsets[time_slot]:self.offsets[time_slot + 1]]
+
+    # Execute the screened contracts of one slot in contract order against the current demand and supply
+    def execute(self, market, time_slot):
+        log_contracts = 'otc' in market.events.wanted
+        executed = 0
+        for i in self.slot_contracts(time_slot).tolist():
+            seller, buyer = self.sellers[i], self.buyers[i]
+            quantity = self.quantities[i, time_slot]
+            available = min(seller.energy_supply[time_slot], buyer.energy_demand[time_slot])
+            if available < quantity:
+                if not self.partial[i] or available <= 0:
+                    continue
+                quantity = available
+
+            # Adjust supply and demand
+            seller.energy_supply[time_slot] -= quantity
+            buyer.energy_demand[time_slot] -= quantity
+
+            # Adjust financial transactions
+            price = self.prices[i]
+            seller.revenue += quantity * price
+            buyer.cost += quantity * price
+            executed += 1
+            if log_contracts:
+                market.events.emit('otc', seller.id, buyer.id, quantity, price, time_slot)
+        return executed
@@ -0,0 +1,181 @@
+import argparse
+import csv
+import html
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from indexes import index_names, t_quantile
+
+# Charts of the report: index -> (title, axis label), drawn like the former plots of simulation.main
+charts = {
+    "price_dispersion": ("Price Dispersion", "Price Dispersion (€/kWh)"),
+    "payment_reduction": ("Payment Reduction", "Payment Reduction (%)"),
+    "income_increase": ("Income Increase", "Income Increase (%)"),
+    "community_welfare": ("Community Welfare", "Community Welfare (%)"),
+}
+replication_keys = ['seed']         # options that only tell replications of a configuration apart
+max_bars = 40                       # configurations per chart, more are split over several files
+confidence = 0.95
+
+# Options that make up a configuration: everything in the results except the indexes and replication keys
+def configuration_keys(results):
+    keys = []
+    for result in results:
+        for key in result:
+            if key not in keys and key not in index_names and key not in replication_keys:
+                keys.append(key)
+    return keys
+
+# One row per configuration (in order of appearance) with mean, std, min, max and the half width of the
+# 95% confidence interval (Student t) of every index over the replications
+def summarize(results, by=None):
+    results = list(results)
+    quantiles = {}
+    by = configuration_keys(results) if by is None else list(by)
+    groups = {}
+    for result in results:
+        groups.setdefault(tuple(result.get(key) for key in by), []).append(result)
+
+    rows = []
+    for configuration, group in groups.items():
+        row = dict(zip(by, configuration))
+        row["replications"] = len(group)
+        for name in index_names:
+            values = np.array([result[name] for result in group if result.get(name) is not None], dtype=float)
+            if len(values) == 0:
+                continue
+            std = float(np.std(values, ddof=1)) if len(values) > 1 else 0.0
+            row[f"{name}_mean"] = float(np.mean(values))
+            row[f"{name}_std"] = std
+            row[f"{name}_min"] = float(np.min(values))
+            row[f"{name}_max"] = float(np.max(values))
+            if len(values) > 1 and len(values) not in quantiles:
+                quantiles[len(values)] = t_quantile(len(values), confidence)
+            row[f"{name}_ci"] = quantiles[len(values)] * std / math.sqrt(len(values)) if len(values) > 1 else 0.0
+        rows.append(row)
+    return rows
+
+def label(row, by):
+    return " + ".join(str(row[key]) for key in by)
+
+# Draw one bar chart into a file. Figures are created without pyplot, so the Agg canvas is used and
+# nothing needs a display. Top level function so the process pool can call it.
+def render_chart(path, title, ylabel, labels, values, errors=None, colors='navy'):
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(max(10, len(labels) * 0.35), 6))
+    axes = figure.subplots()
+    axes.bar(labels, values, color=colors, width=0.5, yerr=errors, capsize=3 if errors is not None else 0)
+    axes.set_xlabel('Configuration')
+    axes.set_ylabel(ylabel)
+    axes.set_title(title)
+    axes.tick_params(axis='x', labelrotation=60)
+    for text in axes.get_xticklabels():
+        text.set_horizontalalignment('right')
+    figure.tight_layout()
+    figure.savefig(path)
+    return path
+
+# Chart jobs (arguments of render_chart) for every index, max_bars configurations per file
+def chart_jobs(rows, by, directory, indexes=charts, file_format='png'):
+    jobs = []
+    pages = math.ceil(len(rows) / max_bars)
+    by = [key for key in by if len({str(row[key]) for row in rows}) > 1] or by      # label with the options that differ
+    for name, (title, ylabel) in indexes.items():
+        if not rows or f"{name}_mean" not in rows[0]:
+            continue
+        for page in range(pages):
+            part = rows[page * max_bars:(page + 1) * max_bars]
+            values = [row[f"{name}_mean"] for row in part]
+            errors = [row[f"{name}_std"] for row in part] if any(row["replications"] > 1 for row in part) else None
+            colors = ['green' if value >= 0 else 'red' for value in values] if name == 'income_increase' else 'navy'
+            suffix = f"_{page + 1}" if pages > 1 else ""
+            path = os.path.join(directory, f"{name}{suffix}.{file_format}")
+            jobs.append((path, f"{title} by Configuration", ylabel, [label(row, by) for row in part], values, errors, colors))
+    return jobs
+
+def render_charts(jobs, workers=None):
+    if workers == 1 or len(jobs) <= 1:
+        return [render_chart(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(jobs))) as pool:
+        return list(pool.map(render_chart, *zip(*jobs)))
+
+def write_csv(rows, path):
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# Write the summary to a Parquet file (needs pyarrow)
+def write_parquet(rows, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    pq.write_table(pa.table({column: [row.get(column) for row in rows] for column in columns}), path)
+
+def format_value(value):
+    return f"{value:.4f}" if isinstance(value, float) else html.escape(str(value))
+
+# Summary table with the charts below it, chart paths are made relative to the HTML file
+def write_html(rows, path, images=()):
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    lines = ["<!DOCTYPE html>", "<html><head><meta charset=\"utf-8\"><title>Simulation report</title>",
+             "<style>table{border-collapse:collapse;font:13px sans-serif}td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style>",
+             "</head><body>", "<table>", "<tr>" + "".join(f"<th>{html.escape(column)}</th>" for column in columns) + "</tr>"]
+    for row in rows:
+        lines.append("<tr>" + "".join(f"<td>{format_value(row.get(column, ''))}</td>" for column in columns) + "</tr>")
+    lines.append("</table>")
+    for image in images:
+        lines.append(f"<p><img src=\"{html.escape(os.path.relpath(image, os.path.dirname(path) or '.'))}\"></p>")
+    lines.append("</body></html>")
+    with open(path, 'w') as file:
+        file.write("\n".join(lines))
+
+writers = {'csv': write_csv, 'parquet': write_parquet}
+
+# Summarize results (dicts with options and index values, e.g. from sweep.run_sweep) per configuration,
+# render the charts in parallel and write the summary table in the given formats to directory.
+# Returns the paths of the written files.
+def write_report(results, directory, by=None, formats=('csv', 'html'), workers=None, chart_format='png'):
+    results = list(results)
+    by = configuration_keys(results) if by is None else list(by)
+    rows = summarize(results, by)
+    os.makedirs(directory, exist_ok=True)
+    images = render_charts(chart_jobs(rows, by, directory, file_format=chart_format), workers)
+    paths = {"charts": images}
+    for file_format in formats:
+        path = os.path.join(directory, f"summary.{file_format}")
+        if file_format == 'html':
+            write_html(rows, path, images)
+        else:
+            writers[file_format](rows, path)
+        paths[file_format] = path
+    return paths
+
+# Results from a JSON list (sweep.py) or JSON lines (multiday.py)
+def load_results(path):
+    with open(path) as file:
+        if path.endswith('.jsonl'):
+            return [json.loads(line) for line in file if line.strip()]
+        return json.load(file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summary table and charts for simulation results")
+    parser.add_argument('results', nargs='+', help="JSON (sweep.py) or JSON lines files with one result per run")
+    parser.add_argument('--output', default='report', help="directory for the charts and summary files")
+    parser.add_argument('--by', nargs='+', help="options that make up a configuration, all except the seed by default")
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'html', 'parquet'], default=['csv', 'html'])
+    parser.add_argument('--chart-format', choices=['png', 'svg', 'pdf'], default='png')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    results = [result for path in args.results for result in load_results(path)]
+    paths = write_report(results, args.output, args.by, args.formats, args.workers, args.chart_format)
+    print(f"{len(paths['charts'])} charts and {', '.join(paths[file_format] for file_format in args.formats)} written")
+    return paths
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
-import matplotlib.pyplot as plt
+import numpy as np
+import loadProfiles
 from market import CDAMarket, Participant, zi_strategy, eob_strategy
-from loadProfiles import *
+from loadProfiles import time_slots, days
+from instrumentation import null_instrumentation
+from checkpoint import load_checkpoint, save_checkpoint
+from mechanisms import ContinuousDoubleAuction
+from battery import battery_config
 from indexes import calculate_average_price, calculate_price_dispersion, calculate_payment_reduction, calculate_income_increase, calculate_community_welfare
 
 # configuration
@@ -16,140 +21,163 @@ trades, provider_buy, provider_sell, traditional_buyers, traditional_sellers, av
 #trades, average_price, price_dispersion, payment_reduction, income_increase, welfare = ([[] for _ in range(4)] for _ in range(6))
 
 # add participants to the market with load profiles and prosumers additionally with pv profiles
-def initialize_participants():      
+def initialize_participants(num_consumers=num_consumers, num_prosumers=num_prosumers, battery_capacity=5, load_profiles=None, pv_profile=None):
+    if load_profiles is None:
+        load_profiles = loadProfiles.load_profiles
+    if pv_profile is None:
+        pv_profile = loadProfiles.G1
     participants = []
     for i in range(num_consumers):
-        m = i % 6
+        m = i % len(load_profiles)
         profile = load_profiles[m]
         participants.append(Participant(id=f'C{i+1}', load_profile=profile))
 
     for i in range(num_prosumers):
-        m = i % 6
+        m = i % len(load_profiles)
         profile = load_profiles[m]      
-        participants.append(Participant(id=f'P{i+1}', load_profile=profile, pv=True, pv_profile=G1, battery_capacity=5))
+        participants.append(Participant(id=f'P{i+1}', load_profile=profile, pv=True, pv_profile=pv_profile, battery_capacity=battery_capacity))
     return participants
 
-def run_simulation(strategy, battery):
+# Run one day and return the market, its metrics hold the indexes so the trades only need to be kept on request.
+# A trade_log receives every match, flushing its last chunk is left to the caller.
+# An instrumentation.Instrumentation collects phase timings and order/match counters.
+# Events go to an events.EventStream, e.g. EventStream([PrintSink()]) for the former debug output.
+# With a checkpoint path the state is saved every checkpoint_every slots, and a run finds an existing
+# checkpoint there and continues after its slot with identical results (events are not replayed).
+# mechanism (see mechanisms.py) clears the order book, the continuous double auction by default.
+# battery is 'bat_CDA', 'CDA_bat', 'no_bat' or, with VectorizedCDAMarket, a battery.DispatchPolicy.
+# incremental keeps orders between rounds and only asks participants with residual demand or supply.
+def run_market(strategy, battery, participants=None, min_price=min_price, max_price=max_price, otc_contracts=otc_contracts, rounds=15, market_class=CDAMarket, rng=None, keep_trades=True, trade_log=None, instrumentation=None, events=None, checkpoint=None, checkpoint_every=1, mechanism=None, incremental=False):
     trade_history = []
-    provider_buy, provider_sell = 0, 0
-    traditional_buyers, traditional_sellers = 0, 0
-    printer = False        # false if no debugging needed
-    if printer:
-        print("-" * 50)
-        print(f"Processing simulation with strategies {strategy.__name__} and " + battery)
-        print("-" * 50)
-
-    market = CDAMarket(initialize_participants(), otc_contracts, min_price, max_price)
-
-    for time_slot in range(time_slots):
-
-        if printer: print(f"Processing time slot {time_slot}...")
+    if participants is None:
+        participants = initialize_participants()
+    market = market_class(participants, otc_contracts, min_price, max_price, rng=rng)
+    market.keep_history = keep_trades
+    market.trade_log = trade_log
+    market.incremental = incremental
+    if events is not None:
+        market.events = events
+
+    if mechanism is None:
+        mechanism = ContinuousDoubleAuction()
+    rounds = mechanism.rounds(rounds)
+
+    state = getattr(market, 'state', market.participants)
+    config = {"strategy": strategy.__name__, "battery": battery_config(battery), "rounds": rounds, "min_price": min_price, "max_price": max_price,
+              "market": market_class.__name__, "keep_trades": keep_trades, "mechanism": mechanism.name}
+    if incremental:
+        config["incremental"] = True
+    first_slot = 0
+    snapshot = load_checkpoint(checkpoint) if checkpoint is not None else None
+    if snapshot is not None:
+        snapshot.check(config, state)
+        snapshot.restore_participants(state)
+        snapshot.restore_market(market)
+        snapshot.restore_rng(rng)
+        if keep_trades:
+            trade_history = snapshot.trade_history()
+        if trade_log is not None:
+            snapshot.restore_trade_log(trade_log)
+        first_slot = snapshot.position["time_slot"] + 1
+
+    timer = null_instrumentation if instrumentation is None else instrumentation
+    for time_slot in range(first_slot, len(market.participants[0].energy_demand) if market.participants else time_slots):
+
+        if 'slot' in market.events.wanted:
+            market.events.emit('slot', time_slot)
+        timer.start_slot(time_slot)
+        started = timer.now()
         market.balance_prosumer_energy(time_slot)
+        started = timer.lap('balance', time_slot, started)
         market.traditional_prices(time_slot)
-        if battery == 'CDA_bat' or battery == 'bat_CDA':
-            market.manage_battery_storage(time_slot, battery, printer)
+        started = timer.lap('traditional', time_slot, started)
+        if battery != 'no_bat':
+            market.manage_battery_storage(time_slot, battery)
+            started = timer.lap('battery', time_slot, started)
         market.apply_otc_contracts(time_slot)
+        started = timer.lap('otc', time_slot, started)
         
-        for round in range(15):  # 15 rounds per 15-minute time slot
-            if printer: print(f"Processing round {round}...")
-            market.collect_orders(strategy, time_slot, round, 15, printer)
-            trades = market.match_orders(time_slot, printer)
-            if printer:   
-               for participant in market.participants:
-                   print(f"Participant {participant.id}: Demand={participant.energy_demand[time_slot]}, Supply={participant.energy_supply[time_slot]}, Revenue={participant.revenue}, Cost={participant.cost}")
-            trade_history.extend(trades)
-
-        market.clear_market(battery, printer)
-    
-    # Update variables for metrics
-    traditional_buyers += market.traditional_buyers
-    traditional_sellers += market.traditional_sellers
-    provider_buy += market.provider_buy
-    provider_sell += market.provider_sell
-
-    return trade_history, provider_buy, provider_sell, traditional_buyers, traditional_sellers
-
-
-results = [] 
-
-for strategy in strategies:
-    for battery in battery_option:
-        print(f"Running simulation for {strategy.__name__} with {battery} strategy")
-        trades, provider_buy, provider_sell, traditional_buyers, traditional_sellers = run_simulation(strategy, battery)
-
-        # Metrics
-        average_price = calculate_average_price(trades)
-        price_dispersion = calculate_price_dispersion(trades, average_price)
-        payment_reduction = calculate_payment_reduction(trades, traditional_buyers, provider_buy)
-        income_increase = calculate_income_increase(trades, traditional_sellers, provider_sell)
-        community_welfare = calculate_community_welfare(trades, traditional_sellers, traditional_buyers, provider_buy, provider_sell)
-
-        # Store results
-        results.append({
-            "strategy": strategy.__name__,
-            "battery": battery,
-            "average_price": np.round(average_price, 4),
-            "price_dispersion": np.round(price_dispersion, 4),
-            "payment_reduction": np.round(payment_reduction, 4),
-            "income_increase": np.round(income_increase, 4),
-            "community_welfare": np.round(community_welfare, 4)
-        })
-
-print("\nSimulation Results Summary:")
-for result in results:
-    print(f"Index for {result['strategy']} + {result['battery']}:")
-    print(f"Average price: {result['average_price']}")
-    print(f"Price dispersion: {result['price_dispersion']}")
-    print(f"Payment reduction: {result['payment_reduction']}%")
-    print(f"Income increase: {result['income_increase']}%")
-    print(f"Community welfare: {result['community_welfare']}%")
-    print("-" * 50) 
-
-strategies_labels = [f"{result['strategy']} + {result['battery']}" for result in results]
-price_dispersions = [result['price_dispersion'] for result in results]
-payment_reductions = [result['payment_reduction'] for result in results]
-income_increases = [result['income_increase'] for result in results]
-community_welfares = [result['community_welfare'] for result in results]
-
-bar_width = 0.5
-
-# Plot für Preisdispersion
-plt.figure(figsize=(10, 6))
-plt.bar(strategies_labels, price_dispersions, color='navy', width=bar_width)
-plt.xlabel('Strategy and Battery Configuration')
-plt.ylabel('Price Dispersion (€/kWh)')
-plt.title('Price Dispersion by Strategy and Battery Configuration')
-plt.xticks(rotation=60)
-plt.tight_layout()
-plt.show()
-
-# Plot für Zahlungsreduktion
-plt.figure(figsize=(10, 6))
-plt.bar(strategies_labels, payment_reductions, color='navy', width=bar_width)
-plt.xlabel('Strategy and Battery Configuration')
-plt.ylabel('Payment Reduction (%)')
-plt.title('Payment Reduction by Strategy and Battery Configuration')
-plt.xticks(rotation=60)
-plt.tight_layout()
-plt.show()
-
-# Plot für Einkommenssteigerung mit unterschiedlichen Farben für positive und negative Werte
-colors = ['green' if x >= 0 else 'red' for x in income_increases]
-plt.figure(figsize=(10, 6))
-plt.bar(strategies_labels, income_increases, color=colors, width=bar_width)
-plt.xlabel('Strategy and Battery Configuration')
-plt.ylabel('Income Increase (%)')
-plt.title('Income Increase by Strategy and Battery Configuration')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
-
-# Plot für Gemeinwohlwerte
-plt.figure(figsize=(12, 6))
-plt.bar(strategies_labels, community_welfares, color='navy', width=bar_width)
-plt.xlabel('Strategy and Battery Configuration')
-plt.ylabel('Community Welfare (%)')
-plt.title('Community Welfare by Strategy and Battery Configuration')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.show()
+        for round in range(rounds):  # 15 rounds per 15-minute time slot
+            market.collect_orders(strategy, time_slot, round, rounds)
+            started = timer.lap('collect', time_slot, started, round)
+            orders, partial_fills = len(market.order_book), market.order_book.partial_fills
+            trades = mechanism.match(market, time_slot)
+            started = timer.lap('match', time_slot, started, round)
+            timer.count_round(time_slot, round, orders, len(trades), market.order_book.partial_fills - partial_fills)
+            if keep_trades:
+                trade_history.extend(trades)
+
+        market.clear_market(battery)
+        timer.lap('clear', time_slot, started)
+        timer.end_slot(time_slot)
+        if checkpoint is not None and (time_slot + 1) % checkpoint_every == 0:
+            save_checkpoint(checkpoint, state, {"time_slot": time_slot}, rng, config, market,
+                            trade_history if keep_trades else None, trade_log)
+
+    market.events.flush()
+    return market, trade_history
+
+def run_simulation(strategy, battery, **options):
+    market, trade_history = run_market(strategy, battery, **options)
+    return trade_history, market.provider_buy, market.provider_sell, market.traditional_buyers, market.traditional_sellers
+
+# Metrics of one simulation run, rounded like in the results summary (decimals=None keeps full precision)
+def calculate_indexes(trades, provider_buy, provider_sell, traditional_buyers, traditional_sellers, decimals=4):
+    average_price = calculate_average_price(trades)
+    indexes = {
+        "average_price": average_price,
+        "price_dispersion": calculate_price_dispersion(trades, average_price),
+        "payment_reduction": calculate_payment_reduction(trades, traditional_buyers, provider_buy),
+        "income_increase": calculate_income_increase(trades, traditional_sellers, provider_sell),
+        "community_welfare": calculate_community_welfare(trades, traditional_sellers, traditional_buyers, provider_buy, provider_sell)
+    }
+    return round_indexes(indexes, decimals)
+
+# Metrics of a finished market, for the whole day or a single time slot, without going through the trades
+def market_indexes(market, time_slot=None, decimals=4):
+    return round_indexes(market.metrics.indexes(time_slot), decimals)
+
+def round_indexes(indexes, decimals):
+    if decimals is None:
+        return indexes
+    return {name: np.round(value, decimals) for name, value in indexes.items()}
+
+
+def main(argv=None):
+    import argparse
+    import report
+    parser = argparse.ArgumentParser(description="Simulate one day for every strategy and battery option")
+    parser.add_argument('--output', default='simulation_report', help="directory for the charts and the summary table")
+    args = parser.parse_args(argv)
+    results = [] 
+
+    for strategy in strategies:
+        for battery in battery_option:
+            print(f"Running simulation for {strategy.__name__} with {battery} strategy")
+            trades, provider_buy, provider_sell, traditional_buyers, traditional_sellers = run_simulation(strategy, battery)
+
+            # Metrics and results
+            results.append({
+                "strategy": strategy.__name__,
+                "battery": battery,
+                **calculate_indexes(trades, provider_buy, provider_sell, traditional_buyers, traditional_sellers)
+            })
+
+    print("\nSimulation Results Summary:")
+    for result in results:
+        print(f"Index for {result['strategy']} + {result['battery']}:")
+        print(f"Average price: {result['average_price']}")
+        print(f"Price dispersion: {result['price_dispersion']}")
+        print(f"Payment reduction: {result['payment_reduction']}%")
+        print(f"Income increase: {result['income_increase']}%")
+        print(f"Community welfare: {result['community_welfare']}%")
+        print("-" * 50) 
+
+    # Charts and summary table are written to files, nothing waits for a display
+    paths = report.write_report([{name: value.item() if isinstance(value, np.generic) else value for name, value in result.items()} for result in results], args.output)
+    print(f"Charts and summary written to {args.output}")
+    return paths
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import loadProfiles
+import simulation
+from cache import ResultCache, cache_key, default_max_bytes
+from market import CDAMarket, zi_strategy, eob_strategy, zi_batch_strategy, eob_batch_strategy
+from community import VectorizedCDAMarket
+from mechanisms import mechanisms
+from tradelog import TradeLog
+
+strategies = {strategy.__name__: strategy for strategy in [zi_strategy, eob_strategy, zi_batch_strategy, eob_batch_strategy]}
+engines = {'cda': CDAMarket, 'vectorized': VectorizedCDAMarket}
+profiles = None       # (load profiles, pv profile) shared by all scenarios of a sweep
+
+# All combinations of the given options, always in the same order
+def scenario_grid(strategies=('zi_strategy', 'eob_strategy'), batteries=('CDA_bat', 'bat_CDA', 'no_bat'), battery_capacities=(5,),
+                  prosumer_ratios=(0.5,), price_bounds=((simulation.min_price, simulation.max_price),), seeds=(0,),
+                  num_participants=simulation.num_consumers + simulation.num_prosumers, rounds=15, engine='cda', mechanisms=('cda',), incremental=False):
+    scenarios = []
+    for strategy, battery, capacity, ratio, (min_price, max_price), seed, mechanism in itertools.product(
+            strategies, batteries, battery_capacities, prosumer_ratios, price_bounds, seeds, mechanisms):
+        scenarios.append({
+            "strategy": strategy,
+            "battery": battery,
+            "battery_capacity": capacity,
+            "prosumer_ratio": ratio,
+            "min_price": min_price,
+            "max_price": max_price,
+            "seed": seed,
+            "num_participants": num_participants,
+            "rounds": rounds,
+            "engine": engine,
+            "mechanism": mechanism,
+            "incremental": incremental
+        })
+    return scenarios
+
+def init_worker(load_profiles, pv_profile):
+    global profiles
+    profiles = (load_profiles, pv_profile)
+
+# Run one scenario, the global RNG used by the strategies is seeded from the scenario itself so the
+# result does not depend on which worker picks it up. With trade_log the result comes with the trade
+# log columns as (result, columns).
+def run_scenario(scenario, trade_log=False):
+    np.random.seed(scenario['seed'])
+    load_profiles, pv_profile = profiles
+    num_prosumers = int(round(scenario['num_participants'] * scenario['prosumer_ratio']))
+    participants = simulation.initialize_participants(
+        num_consumers=scenario['num_participants'] - num_prosumers, num_prosumers=num_prosumers,
+        battery_capacity=scenario['battery_capacity'], load_profiles=load_profiles, pv_profile=pv_profile)
+    ids = {participant.id for participant in participants}
+    otc_contracts = [contract for contract in simulation.otc_contracts if contract[0] in ids and contract[1] in ids]
+    log = TradeLog() if trade_log else None
+    market, _ = simulation.run_market(
+        strategies[scenario['strategy']], scenario['battery'], participants=participants,
+        min_price=scenario['min_price'], max_price=scenario['max_price'], otc_contracts=otc_contracts,
+        rounds=scenario['rounds'], market_class=engines[scenario['engine']], keep_trades=False, trade_log=log,
+        mechanism=mechanisms[scenario['mechanism']](), incremental=scenario.get('incremental', False))
+    result = {**scenario, **{name: float(value) for name, value in simulation.market_indexes(market).items()}}
+    if trade_log:
+        return result, {name: column.copy() for name, column in log.buffered().items()}
+    return result
+
+def run_scenario_with_trades(scenario):
+    return run_scenario(scenario, trade_log=True)
+
+# Cache key of a scenario: its options, the OTC contracts, the profiles and the code version
+def scenario_key(scenario, load_profiles, pv_profile):
+    return cache_key({"scenario": scenario, "otc_contracts": simulation.otc_contracts}, [*load_profiles, pv_profile])
+
+# Spread the scenarios over a process pool, results come back in the order of the scenarios.
+# With a cache.ResultCache only scenarios without a cached result (and trade log with trade_logs=True)
+# are run, their results and trade logs are added to the cache. profiles is (load profiles, pv profile),
+# loadProfiles.load_profiles and G1 by default.
+def run_sweep(scenarios, workers=None, cache=None, trade_logs=False, profiles=None):
+    scenarios = list(scenarios)
+    shared_profiles = (loadProfiles.load_profiles, loadProfiles.G1) if profiles is None else profiles
+    results = [None] * len(scenarios)
+    keys = [None] * len(scenarios)
+    if cache is not None:
+        for i, scenario in enumerate(scenarios):
+            keys[i] = scenario_key(scenario, *shared_profiles)
+            if trade_logs and not os.path.exists(cache.path(keys[i], 'npz')):
+                cache.misses += 1       # cached without its trade log, run again to store it
+                continue
+            results[i] = cache.get(keys[i])
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    run = run_scenario_with_trades if trade_logs and cache is not None else run_scenario
+    if workers == 1:
+        init_worker(*shared_profiles)
+        computed = [run(scenarios[i]) for i in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=shared_profiles) as pool:
+            computed = list(pool.map(run, [scenarios[i] for i in missing]))
+
+    for i, result in zip(missing, computed):
+        trades = None
+        if run is run_scenario_with_trades:
+            result, trades = result
+        if cache is not None:
+            cache.put(keys[i], result, trades)
+        results[i] = result
+    return results
+
+# Same profiles as loadProfiles but with the pv measurement noise drawn from a seeded generator, so the
+# profiles (and with them the cache keys) are identical in every process
+def seeded_profiles(seed):
+    return loadProfiles.load_profiles, loadProfiles.power_to_kwh(loadProfiles.pv_generation(np.random.default_rng(seed)))
+
+def parse_price_bounds(text):
+    min_price, max_price = text.split(':')
+    return float(min_price), float(max_price)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a grid of market simulations in parallel")
+    parser.add_argument('--strategies', nargs='+', default=['zi_strategy', 'eob_strategy'], choices=sorted(strategies))
+    parser.add_argument('--batteries', nargs='+', default=['CDA_bat', 'bat_CDA', 'no_bat'], choices=['CDA_bat', 'bat_CDA', 'no_bat'])
+    parser.add_argument('--capacities', nargs='+', type=float, default=[5])
+    parser.add_argument('--prosumer-ratios', nargs='+', type=float, default=[0.5])
+    parser.add_argument('--price-bounds', nargs='+', type=parse_price_bounds, default=[(simulation.min_price, simulation.max_price)],
+                        help="min:max price pairs in €/kWh")
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--participants', type=int, default=simulation.num_consumers + simulation.num_prosumers)
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--engine', choices=sorted(engines), default='cda')
+    parser.add_argument('--mechanisms', nargs='+', default=['cda'], choices=sorted(mechanisms), help="order book clearing, see mechanisms.py")
+    parser.add_argument('--incremental', action='store_true', help="keep orders between rounds, only re-poll active participants")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='sweep_results.json', help="JSON file for the results")
+    parser.add_argument('--profile-seed', type=int, default=0, help="seed of the pv profile noise")
+    parser.add_argument('--cache', help="result cache directory, only scenarios missing there are run")
+    parser.add_argument('--cache-size', type=float, default=default_max_bytes / 2 ** 20, help="cache size limit in MiB")
+    parser.add_argument('--cache-trades', action='store_true', help="also cache the trade log of every scenario")
+    args = parser.parse_args(argv)
+
+    scenarios = scenario_grid(args.strategies, args.batteries, args.capacities, args.prosumer_ratios, args.price_bounds,
+                              args.seeds, args.participants, args.rounds, args.engine, args.mechanisms, args.incremental)
+    cache = ResultCache(args.cache, int(args.cache_size * 2 ** 20)) if args.cache else None
+    results = run_sweep(scenarios, args.workers, cache, args.cache_trades, seeded_profiles(args.profile_seed))
+    if cache is not None:
+        print(f"{cache.hits} cached, {cache.misses} computed")
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+import multiday
+from community import VectorizedCDAMarket
+from market import CDAMarket, zi_strategy
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+# A season is checkpointed after day 2 and continued in a new process, whose loadProfiles.G1 has different
+# noise: days 3 and 4 must still match the uninterrupted run, so the base profiles have to come from the snapshot
+@pytest.mark.parametrize("engine, market_class", [("cda", CDAMarket), ("vectorized", VectorizedCDAMarket)])
+def test_multiday_resume_in_new_process(tmp_path, engine, market_class):
+    checkpoint = str(tmp_path / "season.ckpt.npz")
+    resumed = str(tmp_path / "resumed.ckpt.npz")
+    expected = []
+    for result in multiday.iterate_days(zi_strategy, 'bat_CDA', 5, market_class=market_class, checkpoint=checkpoint):
+        expected.append(result)
+        if result["day"] == 3:      # the checkpoint still holds the state after day 2
+            shutil.copy(checkpoint, resumed)
+
+    output = str(tmp_path / "resumed.jsonl")
+    subprocess.run([sys.executable, os.path.join(directory, "multiday.py"), "--days", "5", "--strategy", "zi_strategy",
+                    "--battery", "bat_CDA", "--engine", engine, "--checkpoint", resumed, "--output", output], cwd=directory, check=True)
+    with open(output) as file:
+        results = [json.loads(line) for line in file]
+    assert results == expected[3:]
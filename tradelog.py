@@ -0,0 +1,119 @@
+import glob
+import os
+import numpy as np
+
+columns = ['seller', 'buyer', 'quantity', 'price', 'time_slot', 'round', 'day']
+
+# Trade log stored column by column in preallocated NumPy arrays. Participants are stored as integer
+# indices (see CDAMarket.participant_numbers). The buffer doubles until chunk_size rows, after that
+# full chunks are written to compressed .npz files in directory and the buffer is reused, so memory
+# stays bounded on long runs. Without a directory the buffer simply keeps growing.
+class TradeLog:
+    def __init__(self, directory=None, chunk_size=1_000_000, initial_size=1024, value_dtype=np.float64):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.value_dtype = value_dtype
+        self.chunks = 0
+        self.flushed = 0
+        self.size = 0
+        self.day = 0
+        self.allocate(min(initial_size, chunk_size))
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def allocate(self, capacity):
+        self.data = {
+            'seller': np.empty(capacity, dtype=np.int32),
+            'buyer': np.empty(capacity, dtype=np.int32),
+            'quantity': np.empty(capacity, dtype=self.value_dtype),
+            'price': np.empty(capacity, dtype=self.value_dtype),
+            'time_slot': np.empty(capacity, dtype=np.int16),
+            'round': np.empty(capacity, dtype=np.int16),
+            'day': np.empty(capacity, dtype=np.int32)
+        }
+
+    def __len__(self):
+        return self.flushed + self.size
+
+    def append(self, seller, buyer, quantity, price, time_slot, round):
+        if self.size == len(self.data['price']):
+            self.make_room()
+        i = self.size
+        self.data['seller'][i] = seller
+        self.data['buyer'][i] = buyer
+        self.data['quantity'][i] = quantity
+        self.data['price'][i] = price
+        self.data['time_slot'][i] = time_slot
+        self.data['round'][i] = round
+        self.data['day'][i] = self.day
+        self.size += 1
+
+    def make_room(self):
+        capacity = len(self.data['price'])
+        if self.directory is not None and capacity >= self.chunk_size:
+            self.flush()
+            return
+        new_capacity = capacity * 2 if self.directory is None else min(capacity * 2, self.chunk_size)
+        old = self.data
+        self.allocate(new_capacity)
+        for name in columns:
+            self.data[name][:self.size] = old[name][:self.size]
+
+    # Write the buffered rows as the next compressed chunk and empty the buffer
+    def flush(self):
+        if self.directory is None or self.size == 0:
+            return
+        path = os.path.join(self.directory, f'trades_{self.chunks:05d}.npz')
+        np.savez_compressed(path, **{name: self.data[name][:self.size] for name in columns})
+        self.chunks += 1
+        self.flushed += self.size
+        self.size = 0
+
+    # Rows still in memory (views, copy them if the log keeps running)
+    def buffered(self):
+        return {name: self.data[name][:self.size] for name in columns}
+
+def chunk_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, 'trades_*.npz')))
+
+# Read all chunks of a trade log directory into one dict of columns
+def load_trades(directory):
+    parts = [np.load(path) for path in chunk_paths(directory)]
+    return {name: np.concatenate([part[name] for part in parts]) if parts else np.empty(0) for name in columns}
+
+# Consolidate the chunks into one uncompressed .npy file per column, these can be opened with
+# open_npy (np.load with mmap_mode='r') without reading the whole log into memory
+def export_npy(directory, output_directory):
+    os.makedirs(output_directory, exist_ok=True)
+    paths = chunk_paths(directory)
+    total = sum(len(np.load(path)['price']) for path in paths)
+    targets = {}
+    for name in columns:
+        dtype = np.load(paths[0])[name].dtype if paths else np.float64
+        targets[name] = np.lib.format.open_memmap(os.path.join(output_directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(total,))
+    offset = 0
+    for path in paths:
+        chunk = np.load(path)
+        size = len(chunk['price'])
+        for name in columns:
+            targets[name][offset:offset + size] = chunk[name]
+        offset += size
+    for target in targets.values():
+        target.flush()
+
+def open_npy(directory):
+    return {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in columns}
+
+# Write the chunks to a Parquet file, one row group per chunk (needs pyarrow)
+def export_parquet(directory, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    for chunk_path in chunk_paths(directory):
+        chunk = np.load(chunk_path)
+        table = pa.table({name: chunk[name] for name in columns})
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema, compression='zstd')
+        writer.write_table(table)
+    if writer is not None:
+        writer.close()